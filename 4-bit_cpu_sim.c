@@ -3,11 +3,14 @@
 #include <string.h>
 #include <ctype.h>
 #include <unistd.h>
+#include <time.h>
 
 // Function prototypes
 void print_ui(void);
 void program(void);
 void run(void);
+int load_program_file(const char *path);
+void run_headless(long long max_cycles);
 
 // -----------------------------------------------------
 // README! CURRENTLY STILL V2 MOST UP TO DATE IS PYTHON VERSION
@@ -336,7 +339,7 @@ void sub(int value1, int value2) {
         for (int i = 3; i >= 0; i--) {  // right to left
             int diff = registers[reg1][i] - registers[reg2][i] - borrow;
             if (diff < 0) {
-                result[i] = 1 + diff;  // borrow bit becomes 1
+                result[i] = diff + 2;  // borrow from the next bit up
                 borrow = 1;
             } else {
                 result[i] = diff;
@@ -633,12 +636,143 @@ void run(void) {
     }
 }
 
+/*
+Loads a program from a text file into program memory
+    - Accepts the path to a file with one word per line in the same format as user input (`011 0001 0101`)
+        - blank lines and anything after a `#` are ignored
+    - Returns 0 on success, or -1 (after printing why) if the file can't be read, a line isn't a valid word or there are more than 16 words
+        - output is instead stored in 16 words of memory (unused words are zeroed)
+*/
+int load_program_file(const char *path) {
+    FILE *f = fopen(path, "r");
+    if (f == NULL) {
+        perror(path);
+        return -1;
+    }
+
+    char line[256];
+    int line_no = 0;
+    int count = 0;
+    memset(program_memory, 0, sizeof(program_memory));
+
+    while (fgets(line, sizeof(line), f) != NULL) {
+        line_no++;
+        char *comment = strchr(line, '#');
+        if (comment)
+            *comment = '\0';
+
+        // split the line into parts
+        char *parts[4];
+        int n = 0;
+        char *token = strtok(line, " \t\r\n");
+        while (token != NULL && n < 4) {
+            parts[n++] = token;
+            token = strtok(NULL, " \t\r\n");
+        }
+        if (n == 0)
+            continue;   // blank line
+
+        int valid = (n == 3 && strlen(parts[0]) == 3 && strlen(parts[1]) == 4 && strlen(parts[2]) == 4);
+        for (int i = 0; valid && i < 3; i++) {
+            for (int j = 0; parts[i][j] != '\0'; j++) {
+                if (parts[i][j] != '0' && parts[i][j] != '1')
+                    valid = 0;
+            }
+        }
+        if (!valid) {
+            fprintf(stderr, "%s:%d: expected OPCODE (3-bit) INPUT1 (4-bit) INPUT2 (4-bit)\n", path, line_no);
+            fclose(f);
+            return -1;
+        }
+        if (count == 16) {
+            fprintf(stderr, "%s: program has more than 16 words\n", path);
+            fclose(f);
+            return -1;
+        }
+
+        // the three parts are already the 11 bits of the word in order
+        char word[12];
+        snprintf(word, sizeof(word), "%s%s%s", parts[0], parts[1], parts[2]);
+        for (int j = 0; j < 11; j++) {
+            program_memory[count][j] = word[j] - '0';
+        }
+        count++;
+    }
+    fclose(f);
+    return 0;
+}
+
+/*
+Runs the program stored in memory as fast as possible without any ui
+    - Accepts the number of cycles to run for
+    - Resets the clock and executes the same way `run` does, just without clearing, printing or sleeping
+    - Returns nothing
+        - prints the final registers, clock, cycles executed and elapsed time, one `name: value` per line
+*/
+void run_headless(long long max_cycles) {
+    int address, op, instr1, instr2;
+    int i;
+    struct timespec start, end;
+
+    // reset the clock
+    for (i = 0; i < 4; i++) {
+        clock_reg[i] = 0;
+    }
+
+    clock_gettime(CLOCK_MONOTONIC, &start);
+    for (long long c = 0; c < max_cycles; c++) {
+        // convert clock to decimal (treating clock_reg as binary)
+        address = 0;
+        for (i = 0; i < 4; i++) {
+            address = (address << 1) | clock_reg[i];
+        }
+
+        op = 0;
+        for (i = 0; i < 3; i++) {
+            op = (op << 1) | program_memory[address][i];
+        }
+        instr1 = 0;
+        for (i = 3; i < 7; i++) {
+            instr1 = (instr1 << 1) | program_memory[address][i];
+        }
+        instr2 = 0;
+        for (i = 7; i < 11; i++) {
+            instr2 = (instr2 << 1) | program_memory[address][i];
+        }
+
+        if (!process_opcode(op, instr1, instr2))
+            increment_clk();
+    }
+    clock_gettime(CLOCK_MONOTONIC, &end);
+
+    printf("registers:");
+    for (i = 0; i < 15; i++) {
+        printf(" %d", registers[i][0] << 3 | registers[i][1] << 2 | registers[i][2] << 1 | registers[i][3]);
+    }
+    printf("\nclock: %d\n", clock_reg[0] << 3 | clock_reg[1] << 2 | clock_reg[2] << 1 | clock_reg[3]);
+    printf("cycles: %lld\n", max_cycles);
+    printf("elapsed: %.9f\n", (end.tv_sec - start.tv_sec) + (end.tv_nsec - start.tv_nsec) / 1e9);
+}
+
 /*
 Main function
+    - With no arguments starts the interactive simulation
+    - `--headless <program file> <cycles>` runs a program without any ui (see `run_headless`)
 */
-int main() {
+int main(int argc, char *argv[]) {
     int op, val1, val2;
     int jmp_flag;
+
+    if (argc > 1) {
+        if (argc != 4 || strcmp(argv[1], "--headless") != 0) {
+            fprintf(stderr, "usage: %s [--headless <program file> <cycles>]\n", argv[0]);
+            return 1;
+        }
+        if (load_program_file(argv[2]) != 0)
+            return 1;
+        run_headless(atoll(argv[3]));
+        return 0;
+    }
     
     system("clear");  // initially clear the screen
     cycle = 0;   // this has no effect on simulation; just nice to see cycle count
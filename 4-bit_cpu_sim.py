@@ -6,7 +6,7 @@
 # exit: again does as it says and quits (ctrl+c also works)
 # program: captures all user input and puts it into program memory until either the cpu runs out of memory or the user types end
 #   - end: stops programming early
-# run: resets the clock and runs the program currently in memory
+# run: resets the clock and runs the program currently in memory (ctrl+c stops it and goes back to the prompt)
 # 
 # ALU:
 # the rusults of all ALU operations (and or sub add) are stored in reg0, not is by default stored in reg0 but a destination can be specified
@@ -64,7 +64,13 @@
 # 011 0001 0101
 # -----------------------------------------------------
 
-import time, os
+import time, os, sys, argparse, json, threading, asyncio, struct, mmap, array, bisect, hashlib, sqlite3, math
+from collections import OrderedDict
+
+try:
+    import numpy as np
+except ImportError:
+    np = None   # only needed for `run_batch`
 
 # ========================== Helper Functions ==========================
 def int_to_bits(n, bits=4):
@@ -75,15 +81,26 @@ def bits_to_int(bits):
     """Convert a list of bits to an integer."""
     return int("".join(map(str, bits)), 2)
 
-# ========================== Global State ==========================
-_registers = [[0]*4 for _ in range(15)] # 15 registers + clock
-_clock = [0]*4
-_program = [[0]*11 for _ in range(16)]  # 16 words for a program (3 for opcode + 4 for first instruction + 4 for second instruction = 11 bits per word)
-_opcode = [0]*3  # inputs
-_input1 = [0]*4
-_input2 = [0]*4
+def encode_word(op, v1, v2):
+    """Pack an opcode and two 4-bit values into one 11-bit program word."""
+    return ((op & 0x7) << 8) | ((v1 & 0xF) << 4) | (v2 & 0xF)
+
+def decode_word(word):
+    """Split an 11-bit program word back into (opcode, value1, value2)."""
+    return word >> 8, (word >> 4) & 0xF, word & 0xF
 
-_run_speed = 5  # in Hz
+def clock_rate(text):
+    """Read a clock rate in Hz (0 is as fast as possible), raises ValueError for anything negative, infinite or not a number."""
+    hz = float(text)
+    if not math.isfinite(hz) or hz < 0:
+        raise ValueError(f"a clock rate has to be a number of Hz, 0 or more (not {text})")
+    return hz
+
+# ========================== Global State ==========================
+# the machine itself lives in a `CPU` instance (see below), this is just the state of the interactive frontend
+_run_speed = 5  # in Hz (None runs as fast as possible)
+_frame_rate = 30    # how many times a second the screen is redrawn while running
+_check_interval = 4096  # cycles between wall-clock checks when running headless
 
 _prg_mode = False   # flag for jumping and state management
 
@@ -95,34 +112,15 @@ def clear_state():
         - Sets all values in the CPU to zero
         - Returns nothing
     """
-    # include all of the values from global state
-    global _registers, _clock, _program, _opcode, _input1, _input2, _output, _prg_mode
+    global _prg_mode    # include global var
 
     # set all values to 0
-    _registers[:] = [[0]*4 for _ in range(15)]
-    _clock[:]     = [0]*4
-    _program[:]   = [[0]*11 for _ in range(16)]
-    _opcode[:]    = [0]*3
-    _input1[:]    = [0]*4
-    _input2[:]    = [0]*4
-    _output[:]    = [0]*4
-    _prg_mode     = False
+    _cpu.reset()
+    _prg_mode = False
 
 def clear_screen():
     os.system("cls" if os.name == "nt" else "clear")    # added `cross platform` for the only thing that I could think of that wasn't gaurunteed to work
 
-def increment_clk():
-    """
-    Increments the CLK register
-        - Accepts no inputs
-        - Performs 4-bit addition betwen CLK and the value 1
-        - Returns nothing
-            - output is stored in CLK register
-    """
-    # get the current clock and add one to it
-    current = bits_to_int(_clock)
-    _clock[:] = int_to_bits(current + 1, 4)
-
 # ========================== Input Handling ==========================
 def get_user_input():
     """
@@ -138,7 +136,22 @@ def get_user_input():
 
     while True:
         try:
-            user_input = input("Enter opcode (3-bit) and two 4-bit inputs, separated by spaces:\n> ").strip().lower()
+            raw_input = input("Enter opcode (3-bit) and two 4-bit inputs, separated by spaces:\n> ").strip()
+            user_input = raw_input.lower()
+
+            # saving and loading take a file name (which keeps its case)
+            if user_input.split(" ", 1)[0] in {"save", "load"} and not _prg_mode:
+                command, _, path = raw_input.partition(" ")
+                try:
+                    if command.lower() == "save":
+                        save_image(path.strip(), _cpu.program)
+                        print(f"Program saved to {path.strip()}")
+                    else:
+                        _cpu.load_program(read_program_file(path.strip()))
+                        print(f"Program loaded from {path.strip()}")
+                except (OSError, ValueError) as e:
+                    print(e)
+                continue
 
             # cases and handling non-binary commands
             if user_input in {"reset", "exit", "program", "run"} or (user_input == "end" and _prg_mode):
@@ -167,107 +180,1746 @@ def get_user_input():
             exit(0)
 
 # ========================== ALU and Instruction Execution ==========================
-def add(v1, v2):
+def add(regs, v1, v2):
     """
     Adds two 4-bit arrays together
-        - Accepts two values in the form of 4-bit numbers that represent a register address
+        - Accepts a register file and two values in the form of 4-bit numbers that represent a register address
         - Acts like 4 bit addition
         - No overflow flag, overflow is disregarded
         - Returns nothing
             - output is instead added to the first register in the array
     """
-    # convert both values into ints to add, cut off anything above 15, then turn back to int
-    _registers[0] = int_to_bits((bits_to_int(_registers[v1]) + bits_to_int(_registers[v2])) % 16)
+    # add both values and cut off anything above 15
+    regs[0] = (regs[v1] + regs[v2]) % 16
 
-def sub(v1, v2):
+def sub(regs, v1, v2):
     """
     Subtracts two 4-bit arrays
-        - Accepts two values in the form of 4-bit numbers that represent a register address
+        - Accepts a register file and two values in the form of 4-bit numbers that represent a register address
         - subtracts 4-bit number in the register associated with value1 from value2
         - Returns nothing
             - output is instead added to the first register in the array
     """
-    # convert both values into ints to sub, cut off anything above 15, then turn back to int
-    _registers[0] = int_to_bits((bits_to_int(_registers[v1]) - bits_to_int(_registers[v2])) % 16)
+    # subtract both values and wrap anything below 0 back around to 15
+    regs[0] = (regs[v1] - regs[v2]) % 16
 
-def move(v1, v2):
+def move(regs, v1, v2):
     """
     Moves a 4-bit array to another one
-        - Accepts two values in the form of 4-bit numbers that represent a register address
+        - Accepts a register file and two values in the form of 4-bit numbers that represent a register address
         - Moves 4-bit array at address associated with value1 to value2
             - over-writes register at address value2 with register at address value2
         - Returns nothing
             - output is instead the register at address value2
     """
-    _registers[v2] = _registers[v1][:]  # move reg1 over reg2
+    regs[v2] = regs[v1]  # move reg1 over reg2
 
-def immediate(v1, v2):
+def immediate(regs, v1, v2):
     """
     'Inserts' a value into a register
-        - Accepts two values in the form of 4-bit numbers that represent a register address
+        - Accepts a register file and two values in the form of 4-bit numbers that represent a register address
         - Inserts a value2 at the register associated with value1
         - Returns nothing
             - output is instead at the register associated with value1
     """
-    _registers[v1] = int_to_bits(v2)    # write it over
+    regs[v1] = v2 & 0xF   # write it over
 
-def jump_if_zero(v1, v2):
+def jump_if_zero(regs, v1, v2):
     """
     Sets the clock of the cpu to a given value if register at value2 is zero
-        - Accepts one value in the form of 4-bit number
-        - Overwrites the value in CLK with value1 if the value associated with the register at value2 is zero
-        - Returns nothing
-            - output is instead written into the CLK register
+        - Accepts a register file and one value in the form of 4-bit number
+        - Tells the caller to overwrite the value in CLK with value1 if the value associated with the register at value2 is zero
+        - Returns the new value for CLK, or None if the jump didn't happen
+            - the same as every other instruction returns, so None always means "just increment the clock"
     """
-    if bits_to_int(_registers[v2]) == 0:
-        _clock[:] = int_to_bits(v1) # convert value1 to binary and move into clock
-        return True
-    return False    # tell calling function that a jump didn't happen
+    if regs[v2] == 0:
+        return v1 & 0xF     # caller moves value1 into clock
+    return None     # tell calling function that a jump didn't happen
 
-def logical_and(v1, v2):
+def logical_and(regs, v1, v2):
     """
     Performs a logical and operation on two 4-bit arrays
-        - Accepts two values in the form of 4-bit numbers that represent a register address
+        - Accepts a register file and two values in the form of 4-bit numbers that represent a register address
         - Performs an `and` between the registers associated with value1 from value2
         - Returns nothing
             - output is instead added to the first register in the array
     """
-    # convert both values into ints to perform an and then turn back to int
-    _registers[0] = int_to_bits(bits_to_int(_registers[v1]) & bits_to_int(_registers[v2]))
+    # perform an and on both values
+    regs[0] = regs[v1] & regs[v2]
 
-def logical_or(v1, v2):
+def logical_or(regs, v1, v2):
     """
     Performs a logical or operation on two 4-bit arrays
-        - Accepts two values in the form of 4-bit numbers that represent a register address
+        - Accepts a register file and two values in the form of 4-bit numbers that represent a register address
         - Performs an `or` between the registers associated with value1 from value2
         - Returns nothing
             - output is instead added to the first register in the array
     """
-    # convert both values into ints to perform an and then turn back to int
-    _registers[0] = int_to_bits(bits_to_int(_registers[v1]) | bits_to_int(_registers[v2]))
+    # perform an or on both values
+    regs[0] = regs[v1] | regs[v2]
 
-def logical_not(v1, v2):
+def logical_not(regs, v1, v2):
     """
     Performs a logical not operation on two 4-bit arrays
-        - Accepts two values in the form of 4-bit numbers that represent a register address
+        - Accepts a register file and two values in the form of 4-bit numbers that represent a register address
         - Performs an `not` on the register associated with value1 and assigns it to the register associated with value2
         - Returns nothing
             - output is instead added to the register associated with value2
     """
-    # convert the value into an int and not it then turn back to int
-    _registers[v2] = int_to_bits(~bits_to_int(_registers[v1]) & 0xF)
+    # not the value and cut it back down to 4 bits
+    regs[v2] = ~regs[v1] & 0xF
 
-def process_opcode(op, v1, v2):
+def process_opcode(regs, op, v1, v2):
     """
     Processes the input opcode
-        - Accepts three values in the form of a 3-bit opcode and two 4-bit commands
-        - Uses a match case to execute the appropriate function based off of the given opcode
-        - Returns nothing
+        - Accepts a register file and three values in the form of a 3-bit opcode and two 4-bit commands
+        - Looks up the appropriate function based off of the given opcode and runs it
+        - Returns the new value for CLK if a jump happened, otherwise None
     """
-    # map all opcodes to their respective value
-    ops = {0: add, 1: sub, 2: move, 3: immediate, 4: jump_if_zero, 5: logical_and, 6: logical_or, 7: logical_not}
     # get the appropriate code and return
-    return ops.get(op, lambda v1, v2: print("Invalid opcode."))(v1, v2) if op != 4 else jump_if_zero(v1, v2)
+    if 0 <= op < len(_ops):
+        return _ops[op](regs, v1, v2)
+    print("Invalid opcode.")
+
+# map all opcodes to their respective function (built once instead of on every call)
+_ops = (add, sub, move, immediate, jump_if_zero, logical_and, logical_or, logical_not)
+_op_names = ("ADD", "SUB", "MOV", "IMMD", "JMP_IF_ZERO", "AND", "OR", "NOT")   # the mnemonics from the readme, same order
+
+# ========================== Machine Configuration ==========================
+def _make_ops(mask, clock_mask):
+    """
+    Builds the eight ALU functions for a machine of any width
+        - Accepts the mask for a register value and the mask for a program address
+        - Each one does exactly what the 4-bit function with the same opcode does, with the masks baked in
+            - a value is still one int however wide it is, so wider machines cost nothing extra per instruction
+        - Returns a tuple of functions in opcode order, the same shape as `_ops`
+    """
+    def add(regs, v1, v2):
+        regs[0] = (regs[v1] + regs[v2]) & mask
+    def sub(regs, v1, v2):
+        regs[0] = (regs[v1] - regs[v2]) & mask
+    def move(regs, v1, v2):
+        regs[v2] = regs[v1]
+    def immediate(regs, v1, v2):
+        regs[v1] = v2 & mask
+    def jump_if_zero(regs, v1, v2):
+        if regs[v2] == 0:
+            return v1 & clock_mask
+        return None
+    def logical_and(regs, v1, v2):
+        regs[0] = regs[v1] & regs[v2]
+    def logical_or(regs, v1, v2):
+        regs[0] = regs[v1] | regs[v2]
+    def logical_not(regs, v1, v2):
+        regs[v2] = ~regs[v1] & mask
+    return (add, sub, move, immediate, jump_if_zero, logical_and, logical_or, logical_not)
+
+class MachineConfig:
+    """
+    The shape of a machine: how wide a register is, how many registers there are and how many words of program memory
+        - The default is the 4-bit machine this simulator has always been: 4-bit registers, 15 of them, 16 words
+        - Both values in a word are as wide as the widest of: a register value, a register address, a program address
+            - the word is the 3-bit opcode followed by the two values, so the default is still 3 + 4 + 4 = 11 bits
+        - Program memory has to be a power of two so the clock can wrap around with a mask like it always has
+        - Registers are stored one per byte up to 8 bits, wider ones in a plain list (faster to index than an array)
+        - Every CPU method, `decode_program` and `compile_program` work with any configuration,
+          the tools built on top of them (profiling, tracing, images, the assembler...) only know the default machine
+    """
+    __slots__ = ("data_bits", "registers", "words", "value_bits", "word_bits", "mask", "clock_mask", "ops", "storage")
+
+    def __init__(self, data_bits=4, registers=15, words=16):
+        if data_bits < 1 or data_bits > 64 or registers < 1 or words < 2 or words & (words - 1):
+            raise ValueError("need 1 to 64 data bits, at least one register and a power of two words of program memory")
+        self.data_bits = data_bits
+        self.registers = registers
+        self.words = words
+        self.value_bits = max(data_bits, (registers - 1).bit_length(), (words - 1).bit_length())
+        self.word_bits = 3 + 2 * self.value_bits
+        self.mask = (1 << data_bits) - 1
+        self.clock_mask = words - 1
+        default = (data_bits, registers, words) == (4, 15, 16)
+        self.ops = _ops if default else _make_ops(self.mask, self.clock_mask)
+        self.storage = bytearray if data_bits <= 8 else list
+
+    def __eq__(self, other):
+        return isinstance(other, MachineConfig) and self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def __repr__(self):
+        return f"MachineConfig(data_bits={self.data_bits}, registers={self.registers}, words={self.words})"
+
+    def key(self):
+        """Returns (data bits, registers, words), everything else follows from those."""
+        return self.data_bits, self.registers, self.words
+
+    def new_registers(self, values=None):
+        """Makes a register file (all zeros if no values are given)."""
+        return self.storage([0]*self.registers if values is None else values)
+
+    def encode(self, op, v1, v2):
+        """Packs an opcode and two values into one program word."""
+        width = self.value_bits
+        value_mask = (1 << width) - 1
+        return ((op & 0x7) << 2 * width) | ((v1 & value_mask) << width) | (v2 & value_mask)
+
+    def decode(self, word):
+        """Splits a program word back into (opcode, value1, value2)."""
+        width = self.value_bits
+        value_mask = (1 << width) - 1
+        return word >> 2 * width, (word >> width) & value_mask, word & value_mask
+
+_default_config = MachineConfig()
+
+def _default_only(cpu, what):
+    """Raises ValueError if a machine isn't the default 4-bit one (for the things that are built around 4-bit values)."""
+    if cpu.config != _default_config:
+        raise ValueError(f"{what} only works with the default 4-bit machine, not {cpu.config!r}")
+
+_decode_cache = {}  # decoded programs keyed by their machine and words, shared between every CPU running the same program
+_decode_cache_limit = 4096  # forget everything once this many programs have been decoded
+
+def decode_program(words, config=None):
+    """
+    Decodes every word of a program ahead of time
+        - Accepts a tuple with a word for every address and the machine it's for (the 4-bit machine if None)
+        - Returns a tuple with a (handler, value1, value2) entry for every word so the run loop never has to decode anything
+            - the same tuple is handed to every caller with the same program, so thousands of machines only pay for it once
+    """
+    return _shared_program(words, config)[1]
+
+def _shared_program(words, config=None):
+    """
+    Looks a program up in the decode cache, decoding it the first time
+        - Accepts a tuple with a word for every address and the machine it's for (the 4-bit machine if None)
+        - Returns (words, decoded), where `words` is the tuple that was cached first, so every machine with
+          the same program can hold on to that one instead of its own copy
+    """
+    config = config or _default_config
+    key = (config, words)
+    entry = _decode_cache.get(key)
+    if entry is None:
+        if len(_decode_cache) >= _decode_cache_limit:
+            _decode_cache.clear()
+        entry = _decode_cache[key] = (words, tuple(decode_entry(word, config) for word in words))
+    return entry
+
+def decode_entry(word, config=None):
+    """Turns one program word into the (handler, value1, value2) entry the run loop calls."""
+    config = config or _default_config
+    op, v1, v2 = config.decode(word)
+    return config.ops[op], v1, v2
+
+def register_operands(op, v1, v2):
+    """Returns the register addresses a decoded word reads or writes through its two values."""
+    if op == 3:
+        return (v1,)    # value2 is a number not a register
+    if op == 4:
+        return (v2,)    # value1 is a program address not a register
+    return (v1, v2)
+
+def register_reads(op, v1, v2):
+    """Returns the registers a decoded word reads (a jump reads the one it tests)."""
+    if op == 3:
+        return ()
+    if op == 4:
+        return (v2,)
+    if op in (2, 7):
+        return (v1,)    # MOV and NOT only read their source
+    return (v1, v2)
+
+def register_dest(op, v1, v2):
+    """Returns the register a decoded word writes, or None for a jump."""
+    if op == 4:
+        return None
+    if op == 3:
+        return v1
+    if op in (2, 7):
+        return v2
+    return 0    # ADD, SUB, AND and OR always write R0
+
+# ========================== Program Compiler ==========================
+_compiled_cache = {}    # compiled functions keyed by the contents of program memory
+_compiled_cache_limit = 1024    # forget everything once this many programs have been compiled
+
+_block_limit = 64   # longest block of straight-line code, so big program memories don't make huge functions
+
+def _compile_source(words, config=None):
+    """
+    Translates program memory into the source code of one python function
+        - Accepts a word for every address and the machine they're for (the 4-bit machine if None)
+        - Every address gets a block of straight-line code on local variables that runs until the first jump (or the end of memory)
+            - a jump just sets the next block to run, and the next block is picked at the top of a `while` loop
+            - the blocks that can be reached from P0 are picked first, by halving a list of just their start addresses,
+              so a jump costs the same few comparisons however big memory is
+            - anything else (only ever the clock the function was called with) is picked by halving the whole address range
+            - any word that touches a register that doesn't exist (R15) ends the block so the interpreter can raise the same error it always does
+        - Returns the source as a string, the function it defines is `(registers, clock, cycles) -> (clock, cycles left)`
+    """
+    config = config or _default_config
+    mask, size = config.mask, config.words
+    regs = ", ".join(f"r{i}" for i in range(config.registers))
+    blocks = []
+    for start in range(size):
+        body = []
+        addr, nxt, jump = start, None, ()
+        while nxt is None:
+            op, v1, v2 = config.decode(words[addr])
+            if max(register_operands(op, v1, v2)) >= config.registers:
+                nxt = addr  # hand this word back to the interpreter
+                break
+            if op == 0:
+                body.append(f"r0 = (r{v1} + r{v2}) & {mask}")
+            elif op == 1:
+                body.append(f"r0 = (r{v1} - r{v2}) & {mask}")
+            elif op == 2:
+                body.append(f"r{v2} = r{v1}")
+            elif op == 3:
+                body.append(f"r{v1} = {v2 & mask}")
+            elif op == 5:
+                body.append(f"r0 = r{v1} & r{v2}")
+            elif op == 6:
+                body.append(f"r0 = r{v1} | r{v2}")
+            elif op == 7:
+                body.append(f"r{v2} = ~r{v1} & {mask}")
+            addr += 1
+
+            if op == 4:
+                nxt = f"{v1 & config.clock_mask} if r{v2} == 0 else {addr & config.clock_mask}"
+                jump = (v1 & config.clock_mask, addr & config.clock_mask)
+            elif addr == size:
+                nxt = 0     # wrap around to the start of memory just like the clock does
+                jump = (0,)
+            elif addr - start == _block_limit:
+                nxt = addr
+                jump = (addr,)
+        blocks.append((addr - start, body, nxt, jump))
+
+    # every block start the program can get to from P0
+    hot, work = {0}, [0]
+    while work:
+        length, body, nxt, jump = blocks[work.pop()]
+        for target in (jump if length else ()):
+            if target not in hot:
+                hot.add(target)
+                work.append(target)
+
+    lines = ["def _compiled(registers, pc, left):",
+             f"    {regs}, = registers",
+             "    while True:"]
+
+    def pick_hot(entries, indent):
+        # each start is checked exactly, a pc that isn't one of them falls through every check to the full range below
+        pad = " " * indent
+        if len(entries) > 1:
+            mid = len(entries) // 2
+            lines.append(f"{pad}if pc < {entries[mid]}:")
+            pick_hot(entries[:mid], indent + 4)
+            pick_hot(entries[mid:], indent)
+            return
+        lines.append(f"{pad}if pc == {entries[0]}:")
+        block(entries[0], indent + 4)
+
+    def pick(lo, hi, indent):
+        # every block ends in `continue` or `break`, so the upper half only runs when pc isn't in the lower one
+        pad = " " * indent
+        if hi - lo > 1:
+            mid = (lo + hi) // 2
+            lines.append(f"{pad}if pc < {mid}:")
+            pick(lo, mid, indent + 4)
+            pick(mid, hi, indent)
+            return
+        block(lo, indent)
+
+    def block(start, indent):
+        pad = " " * indent
+        length, body, nxt, jump = blocks[start]
+        if length == 0:
+            lines.append(f"{pad}break")
+            return
+        lines.append(f"{pad}if left < {length}:")
+        lines.append(f"{pad}    break")
+        lines.append(f"{pad}left -= {length}")
+        lines.extend(f"{pad}{line}" for line in body)
+        lines.append(f"{pad}pc = {nxt}")
+        lines.append(f"{pad}continue")
+
+    pick_hot(sorted(hot), 8)
+    pick(0, size, 8)
+    lines.append(f"    registers[:] = _storage(({regs},))")
+    lines.append("    return pc, left")
+    return "\n".join(lines) + "\n"
+
+def compile_program(words, config=None):
+    """
+    Compiles a program into a single python function
+        - Accepts a word for every address and the machine they're for (the 4-bit machine if None)
+        - Only compiles each different program once, repeats come straight out of a cache
+        - Returns the function described in `_compile_source`
+            - it runs whole blocks while the cycle budget allows and returns the clock and the cycles it didn't use
+            - the leftover cycles (always fewer than the next block) have to be finished with the interpreter
+    """
+    config = config or _default_config
+    key = (config, tuple(words))
+    fn = _compiled_cache.get(key)
+    if fn is None:
+        if len(_compiled_cache) >= _compiled_cache_limit:
+            _compiled_cache.clear()
+        namespace = {"_storage": bytes if config.storage is bytearray else config.storage}
+        exec(_compile_source(key[1], config), namespace)
+        fn = _compiled_cache[key] = namespace["_compiled"]
+    return fn
+
+# ========================== CPU ==========================
+class CPU:
+    """
+    One complete machine: 15 registers, the clock and 16 words of program memory (or the shape given by a `MachineConfig`)
+        - Every machine is independent, so any number of them can be run side by side in one process
+        - Program memory is an immutable tuple and the decoded program comes out of a shared cache
+            - machines running the same program share both, so each one only really owns its registers and clock
+    """
+    __slots__ = ("registers", "clock", "program", "decoded", "config")
+
+    def __init__(self, program=None, registers=None, config=None):
+        self.config = config or _default_config
+        self.registers = self.config.new_registers(registers)  # 15 registers, one 4-bit value per byte by default
+        self.clock = 0  # 4-bit clock by default, also used as the program counter
+        self.load_program(() if program is None else program)
+
+    def reset(self):
+        """
+        Clears all of the registers, the clock and program memory
+            - Accepts no inputs
+            - Returns nothing
+        """
+        self.registers[:] = self.config.new_registers()
+        self.clock = 0
+        self.load_program(())
+
+    def load_program(self, words):
+        """
+        Replaces program memory
+            - Accepts up to 16 11-bit words (missing words at the end are zeroed)
+            - Doesn't touch the registers or the clock
+            - Returns nothing
+        """
+        words = tuple(words)
+        size = self.config.words
+        if len(words) > size:
+            raise ValueError(f"program has {len(words)} words, memory only holds {size}")
+        self.program, self.decoded = _shared_program(words + (0,)*(size - len(words)), self.config)
+
+    def write_word(self, addr, word):
+        """
+        Writes one word into program memory
+            - Accepts an address (0-15) and an 11-bit word
+            - Only the decoded entry for that address is replaced
+            - Returns nothing
+        """
+        self.program = self.program[:addr] + (word,) + self.program[addr + 1:]
+        self.decoded = self.decoded[:addr] + (decode_entry(word, self.config),) + self.decoded[addr + 1:]
+
+    def increment_clk(self):
+        """
+        Increments the CLK register
+            - Accepts no inputs
+            - Performs 4-bit addition betwen CLK and the value 1
+            - Returns nothing
+        """
+        # add one to the clock and wrap around after 15
+        self.clock = (self.clock + 1) & self.config.clock_mask
+
+    def execute(self, op, v1, v2):
+        """
+        Executes one instruction that isn't in program memory (what the interactive frontend does with user input)
+            - Accepts a 3-bit opcode and two 4-bit values
+            - Moves the clock to the jump target, or on by one if there was no jump
+            - Returns nothing
+        """
+        nxt = self.config.ops[op](self.registers, v1, v2)
+        self.clock = (self.clock + 1) & self.config.clock_mask if nxt is None else nxt
+
+    def step(self):
+        """
+        Executes the word in program memory the clock currently points at
+            - Accepts no inputs
+            - Returns nothing
+        """
+        handler, v1, v2 = self.decoded[self.clock]
+        nxt = handler(self.registers, v1, v2)
+        self.clock = (self.clock + 1) & self.config.clock_mask if nxt is None else nxt
+
+    def run(self, max_cycles=None, deadline=None, compiled=False, fast_forward=False):
+        """
+        Runs program memory from the current clock as fast as possible
+            - Accepts an optional cycle budget and an optional wall-clock deadline in seconds
+                - with neither the program runs until interrupted
+            - Accepts a flag to run the program through `compile_program` instead of the interpreter
+            - Accepts a flag to skip over whole trips around a loop once one is found (only used with a cycle budget)
+                - ends up in exactly the same state as running every cycle, but a loop only has to be run about twice
+            - Returns the number of cycles executed (counting the ones that were skipped)
+        """
+        if fast_forward and max_cycles is not None:
+            loop = self.fast_forward(max_cycles, deadline, compiled)
+            if loop["verdict"] == "fault":
+                self.step()     # raises the same error the plain interpreter would have
+            return loop["cycles"]
+
+        regs, decoded, clock, mask = self.registers, self.decoded, self.clock, self.config.clock_mask
+        stop_at = None if deadline is None else time.perf_counter() + deadline
+        fn = compile_program(self.program, self.config) if compiled else None
+        cycles = 0
+
+        try:
+            while max_cycles is None or cycles < max_cycles:
+                # only look at the time every so often so the check doesn't dominate the loop
+                batch = _check_interval if max_cycles is None else min(_check_interval, max_cycles - cycles)
+                if fn is not None and stop_at is None and max_cycles is not None:
+                    batch = max_cycles - cycles   # nothing to check in between so hand the whole budget over at once
+
+                left = batch
+                if fn is not None:
+                    clock, left = fn(regs, clock, batch)
+                for _ in range(left):
+                    handler, v1, v2 = decoded[clock]
+                    nxt = handler(regs, v1, v2)
+                    clock = (clock + 1) & mask if nxt is None else nxt
+                cycles += batch
+
+                if stop_at is not None and time.perf_counter() >= stop_at:
+                    break
+        finally:
+            self.clock = clock  # keep the clock right even if a bad word stopped the run
+        return cycles
+
+    def fast_forward(self, max_cycles, deadline=None, compiled=False):
+        """
+        Runs exactly `max_cycles` cycles, skipping every whole trip around a loop once one is found
+            - Accepts a cycle budget, an optional wall-clock deadline in seconds and the same `compiled` flag as `run`
+            - Finds the loop with `find_loop`, which already walks the real timeline, so if no loop turns up the machine is simply done
+            - Otherwise the machine sits at the start of the loop, every whole trip around it is skipped and only the remainder is run
+            - A fault doesn't raise here, the machine is just left in front of the bad word
+            - Returns the dict from `find_loop`, with `cycles` moved on to `max_cycles` if a loop was skipped over
+        """
+        loop = self.find_loop(max_cycles, deadline)
+        if loop["verdict"] in ("halted", "loop"):
+            self.run((max_cycles - loop["start"]) % loop["period"], compiled=compiled)
+            loop["cycles"] = max_cycles
+        return loop
+
+    def find_loop(self, max_cycles=None, deadline=None):
+        """
+        Runs program memory from the current state until the state (registers + clock) repeats
+            - Accepts an optional cycle budget and an optional wall-clock deadline in seconds
+            - Uses Brent's cycle detection, so only two copies of the state are ever kept no matter how long it runs
+            - The machine is left at the first cycle of the loop (or where it faulted / ran out of budget)
+            - Returns a dict with:
+                - `verdict`: "halted" (jumping to itself forever), "loop", "fault" (touched R15) or "budget" (no repeat found in time)
+                - `pc`: the clock at the start of the loop (or at the fault)
+                - `start`: the cycle the loop starts on, `period`: how many cycles one trip around the loop takes (0 if there was no loop)
+                - `cycles`: which cycle the machine was left on
+        """
+        decoded, mask, copy = self.decoded, self.config.clock_mask, self.config.storage
+        stop_at = None if deadline is None else time.perf_counter() + deadline
+        start_regs, start_clock = copy(self.registers), self.clock
+
+        def result(verdict, regs, clock, start, period, cycles):
+            self.registers[:] = regs
+            self.clock = clock
+            return {"verdict": verdict, "pc": clock, "start": start, "period": period, "cycles": cycles}
+
+        # phase 1: the hare runs ahead and the tortoise jumps to it every power of two until they meet
+        hare, hclock = copy(start_regs), start_clock
+        tort, tclock = start_regs, start_clock
+        power = period = 0
+        steps = 0
+        while True:
+            if power == period:
+                tort, tclock = copy(hare), hclock
+                power = power * 2 or 1
+                period = 0
+            if max_cycles is not None and steps >= max_cycles:
+                return result("budget", hare, hclock, 0, 0, steps)
+            if stop_at is not None and steps % _check_interval == 0 and time.perf_counter() >= stop_at:
+                return result("budget", hare, hclock, 0, 0, steps)
+
+            handler, v1, v2 = decoded[hclock]
+            try:
+                nxt = handler(hare, v1, v2)
+            except IndexError:
+                return result("fault", hare, hclock, 0, 0, steps)
+            hclock = (hclock + 1) & mask if nxt is None else nxt
+            steps += 1
+            period += 1
+            if hclock == tclock and hare == tort:
+                break
+
+        # phase 2: start one copy a whole period ahead of the other, they meet at the start of the loop
+        tort, tclock = copy(start_regs), start_clock
+        hare, hclock = copy(start_regs), start_clock
+        for _ in range(period):
+            handler, v1, v2 = decoded[hclock]
+            nxt = handler(hare, v1, v2)
+            hclock = (hclock + 1) & mask if nxt is None else nxt
+        start = 0
+        while hclock != tclock or hare != tort:
+            handler, v1, v2 = decoded[tclock]
+            nxt = handler(tort, v1, v2)
+            tclock = (tclock + 1) & mask if nxt is None else nxt
+            handler, v1, v2 = decoded[hclock]
+            nxt = handler(hare, v1, v2)
+            hclock = (hclock + 1) & mask if nxt is None else nxt
+            start += 1
+
+        # the clock can only stay put when a jump lands on itself, so a period of one means the program has halted
+        return result("halted" if period == 1 else "loop", tort, tclock, start, period, start)
+
+_cpu = CPU()    # the machine the interactive frontend drives
+
+# ========================== Profiling ==========================
+class Profiler:
+    """
+    Counts what a machine spends its cycles on
+        - `attach` swaps the machine's decoded program for one where every word counts itself before returning
+            - nothing is checked on every cycle, so a machine without a profiler attached runs exactly as fast as before
+            - only the interpreter goes through the decoded program, compiled runs can't be profiled
+        - Counts executions per opcode, hits per program address, taken and not-taken jumps per address, and reads and writes per register
+    """
+    def __init__(self):
+        self.op_counts = [0]*8
+        self.pc_hits = [0]*16
+        self.jumps_taken = [0]*16
+        self.jumps_not_taken = [0]*16
+        self.reg_reads = [0]*15
+        self.reg_writes = [0]*15
+
+    def attach(self, cpu):
+        """
+        Starts counting everything the given machine executes
+            - Accepts a CPU
+            - Loading a new program into the machine detaches the profiler again
+            - Returns nothing
+        """
+        _default_only(cpu, "Profiler")
+        cpu.decoded = tuple(self._counted(addr, word) for addr, word in enumerate(cpu.program))
+
+    def detach(self, cpu):
+        """Puts the machine's normal decoded program back (the counts are kept)."""
+        cpu.decoded = decode_program(cpu.program)
+
+    def _counted(self, addr, word):
+        """
+        Builds the counting version of one decoded entry
+            - Accepts the address and the word stored there
+            - Returns a (handler, value1, value2) entry just like `decode_entry`, the handler runs the real one then counts
+        """
+        op, v1, v2 = decode_word(word)
+        handler = _ops[op]
+        reads = register_reads(op, v1, v2)
+        writes = () if op == 4 else (register_dest(op, v1, v2),)
+        op_counts, pc_hits, reg_reads, reg_writes = self.op_counts, self.pc_hits, self.reg_reads, self.reg_writes
+        jumps_taken, jumps_not_taken = self.jumps_taken, self.jumps_not_taken
+
+        def counted(regs, v1, v2):
+            nxt = handler(regs, v1, v2)   # run it first so a bad word raises before anything is counted
+            op_counts[op] += 1
+            pc_hits[addr] += 1
+            for r in reads:
+                reg_reads[r] += 1
+            for r in writes:
+                reg_writes[r] += 1
+            if op == 4:
+                if nxt is None:
+                    jumps_not_taken[addr] += 1
+                else:
+                    jumps_taken[addr] += 1
+            return nxt
+        return counted, v1, v2
+
+    def to_dict(self):
+        """Returns all of the counts as a dict (opcodes are keyed by their mnemonic)."""
+        return {
+            "cycles": sum(self.pc_hits),
+            "opcodes": dict(zip(_op_names, self.op_counts)),
+            "pc_hits": self.pc_hits,
+            "jumps_taken": self.jumps_taken,
+            "jumps_not_taken": self.jumps_not_taken,
+            "register_reads": self.reg_reads,
+            "register_writes": self.reg_writes,
+        }
+
+    def dump(self, path):
+        """Writes `to_dict` to a json file."""
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def hot_spots(self, program, limit=16):
+        """
+        Builds a table of the busiest program addresses
+            - Accepts the program the counts came from and how many rows to show
+            - Returns the table as a string
+        """
+        total = sum(self.pc_hits) or 1
+        lines = ["ADDR  WORD                   HITS      %   JMP TAKEN/NOT"]
+        for addr in sorted(range(16), key=lambda a: -self.pc_hits[a])[:limit]:
+            if self.pc_hits[addr] == 0:
+                break
+            op, v1, v2 = decode_word(program[addr])
+            jumps = f"{self.jumps_taken[addr]}/{self.jumps_not_taken[addr]}" if op == 4 else ""
+            lines.append(f"P{addr:<4} {_op_names[op]:<11} {v1:>2} {v2:>2} {self.pc_hits[addr]:>11} {self.pc_hits[addr] / total:>6.1%}   {jumps}")
+        return "\n".join(lines)
+
+# ========================== Tracing ==========================
+# every traced cycle is one 32-bit record (little-endian in files):
+#   bits 0-3 address, 4-6 opcode, 7-10 value1, 11-14 value2, 15-18 register written (15 = none), 19-22 the value written, 23 jump taken
+# a trace file is the same 8 byte header as a program image (with "L4TR" as the magic) followed by the records
+_trace_magic = b"L4TR"
+_trace_no_write = 15
+_trace_record_size = 4
+
+def trace_record(addr, op, v1, v2, dest=_trace_no_write, value=0, taken=False):
+    """Packs one cycle into a trace record."""
+    return addr | op << 4 | v1 << 7 | v2 << 11 | dest << 15 | value << 19 | taken << 23
+
+def unpack_trace_record(record):
+    """
+    Unpacks a trace record
+        - Accepts the 32-bit record
+        - Returns (address, opcode, value1, value2, register written or None, value written, jump taken)
+    """
+    dest = (record >> 15) & 0xF
+    return (record & 0xF, (record >> 4) & 0x7, (record >> 7) & 0xF, (record >> 11) & 0xF,
+            None if dest == _trace_no_write else dest, (record >> 19) & 0xF, bool(record >> 23 & 1))
+
+class Tracer:
+    """
+    Records every cycle a machine executes
+        - `attach` wraps every entry of the machine's decoded program (like `Profiler`, which it can be stacked on top of)
+            - only the interpreter goes through the decoded program, compiled and fast forwarded runs can't be traced
+        - Records go into a ring buffer that's allocated once, so it always holds the last `capacity` cycles
+        - With a path every full buffer is written to the file as well, so a run of any length never holds more than one buffer
+    """
+    def __init__(self, capacity=65536, path=None):
+        self.capacity = capacity
+        self.ring = array.array("I", bytes(4 * capacity))
+        self.pos = 0        # where the next record goes
+        self.flushed = 0    # records that went around the ring before this one (and into the file if there is one)
+        self.file = None
+        if path:
+            self.file = open(path, "wb")
+            self.file.write(_image_header.pack(_trace_magic, 1, 0, 4))
+
+    def attach(self, cpu):
+        """
+        Starts recording everything the given machine executes
+            - Accepts a CPU
+            - Loading a new program into the machine detaches the tracer again
+            - Returns nothing
+        """
+        _default_only(cpu, "Tracer")
+        self._untraced = cpu.decoded
+        cpu.decoded = tuple(self._traced(addr, word, entry[0]) for addr, (word, entry) in enumerate(zip(cpu.program, cpu.decoded)))
+
+    def detach(self, cpu):
+        """Puts the machine's decoded program back the way it was and writes whatever is left to the file (and closes it)."""
+        cpu.decoded = self._untraced
+        if self.file:
+            self._write(self.ring[:self.pos])
+            self.file.close()
+            self.file = None
+
+    def _write(self, records):
+        """Writes records to the trace file in little-endian order whatever the machine is."""
+        if sys.byteorder != "little":
+            records = array.array("I", records)
+            records.byteswap()
+        self.file.write(records)
+
+    def _wrap(self):
+        """Called when the ring is full, writes it out and starts again at the beginning."""
+        if self.file:
+            self._write(self.ring)
+        self.flushed += self.capacity
+        self.pos = 0
+
+    def _traced(self, addr, word, handler):
+        """
+        Builds the recording version of one decoded entry
+            - Accepts the address, the word stored there and the handler to call (the real one or another wrapper)
+            - Returns a (handler, value1, value2) entry just like `decode_entry`
+            - Every record this address can make is worked out here, so a cycle only costs a lookup and a store
+        """
+        op, v1, v2 = decode_word(word)
+        dest = register_dest(op, v1, v2)
+        if dest is None or dest > 14:   # jumps don't write, and writes to R15 raise before anything is recorded
+            dest = _trace_no_write
+        records = tuple(trace_record(addr, op, v1, v2, dest, value) for value in range(16))
+        taken = trace_record(addr, op, v1, v2, taken=True)
+        tracer = self
+
+        def traced(regs, v1, v2):
+            nxt = handler(regs, v1, v2)
+            if op == 4:
+                tracer.ring[tracer.pos] = records[0] if nxt is None else taken
+            else:
+                tracer.ring[tracer.pos] = records[regs[dest]] if dest != _trace_no_write else records[0]
+            tracer.pos += 1
+            if tracer.pos == tracer.capacity:
+                tracer._wrap()
+            return nxt
+        return traced, v1, v2
+
+    def __len__(self):
+        """Returns the number of cycles recorded so far."""
+        return self.flushed + self.pos
+
+    def records(self):
+        """Yields the cycles still in the ring buffer, oldest first, unpacked like `unpack_trace_record`."""
+        ring = self.ring[self.pos:] + self.ring[:self.pos] if self.flushed else self.ring[:self.pos]
+        for record in ring:
+            yield unpack_trace_record(record)
+
+def read_trace(path, chunk=65536):
+    """
+    Reads a trace file back lazily
+        - Accepts the path and how many records to read at a time
+        - Raises ValueError if the file isn't a trace
+        - Yields every cycle in order, unpacked like `unpack_trace_record`
+    """
+    with open(path, "rb") as f:
+        header = f.read(_image_header.size)
+        if len(header) < _image_header.size or _image_header.unpack(header)[0] != _trace_magic:
+            raise ValueError(f"{path}: not a trace file")
+        while True:
+            data = f.read(_trace_record_size * chunk)
+            if not data:
+                break
+            records = array.array("I", data[:len(data) - len(data) % _trace_record_size])
+            if sys.byteorder != "little":
+                records.byteswap()
+            for record in records:
+                yield unpack_trace_record(record)
+
+# ========================== Checkpoints ==========================
+class Timeline:
+    """
+    Lets a machine go back to any earlier cycle
+        - Every `interval` cycles the whole state is saved (16 bytes plus a reference to the program, which never gets copied)
+        - Between saves every cycle leaves a 32-bit undo record (the address it ran at, the register it wrote and what was there before)
+            - going back a little just plays the undo records backwards
+            - going back further restores the nearest save before that cycle and runs forward from it
+        - When there are more than `max_snapshots` saves (at least 2), the one whose neighbours are closest together
+          for how long ago it was is dropped (never the first or the newest), and the interval never changes
+            - so memory never goes past `max_snapshots` saves plus `interval` undo records however long the machine runs
+            - the saves that are left get further apart the older they are, so recent cycles are quick to go back to
+              and going back further replays more, about in proportion to how far back it is
+        - Works by wrapping the decoded program like `Profiler`, so only the interpreter is used while attached
+            - loading a program or writing a word means making a new timeline
+    """
+    def __init__(self, cpu, interval=1024, max_snapshots=256):
+        _default_only(cpu, "Timeline")
+        self.cpu = cpu
+        self.interval = interval
+        self.max_snapshots = max(max_snapshots, 2)
+        self.snapshots = []     # (cycle, registers + clock, program), oldest first
+        self.cycles = []        # just the cycle of every snapshot, for bisecting
+        self.undo = array.array("I")
+        self._untimed = cpu.decoded
+        self._wrap()
+        self._save(0)
+
+    def _wrap(self):
+        """Swaps the machine's decoded program for one that leaves undo records."""
+        self.cpu.decoded = tuple(self._undoable(addr, word, entry[0])
+                                 for addr, (word, entry) in enumerate(zip(self.cpu.program, self.cpu.decoded)))
+
+    def _undoable(self, addr, word, handler):
+        """Builds the version of one decoded entry that records what it's about to overwrite."""
+        op, v1, v2 = decode_word(word)
+        undo = self.undo
+        if op == 4:
+            record = addr | 15 << 4   # jumps only change the clock, which every record has
+            def undoable(regs, v1, v2):
+                nxt = handler(regs, v1, v2)
+                undo.append(record)
+                return nxt
+        else:
+            dest = register_dest(op, v1, v2)
+            record = addr | dest << 4
+            def undoable(regs, v1, v2):
+                old = regs[dest]
+                nxt = handler(regs, v1, v2)
+                undo.append(record | old << 8)
+                return nxt
+        return undoable, v1, v2
+
+    def detach(self):
+        """Puts the machine's decoded program back the way it was (the machine keeps whatever cycle it's on)."""
+        self.cpu.decoded = self._untimed
+
+    @property
+    def cycle(self):
+        """The number of cycles the machine has run since the timeline started."""
+        return self.cycles[-1] + len(self.undo)
+
+    def _save(self, cycle):
+        """Saves the current state as the snapshot for `cycle` and starts a fresh undo log."""
+        self.snapshots.append((cycle, bytes(self.cpu.registers) + bytes((self.cpu.clock,)), self.cpu.program))
+        self.cycles.append(cycle)
+        del self.undo[:]
+        if len(self.snapshots) > self.max_snapshots:
+            # the newest snapshot always stays (the undo log starts from it), and so does the first one
+            cycles = self.cycles
+            i = min(range(1, len(cycles) - 1), key=lambda i: (cycles[i + 1] - cycles[i - 1]) / (cycle - cycles[i]))
+            del self.snapshots[i], self.cycles[i]
+
+    def run(self, cycles):
+        """
+        Runs the machine forward, saving snapshots along the way
+            - Accepts the number of cycles
+            - Raises IndexError if the program faults, `cycle` is still right afterwards
+            - Returns the number of cycles run
+        """
+        target = self.cycle + cycles
+        while self.cycle < target:
+            # run up to the next multiple of the interval (or the target if that comes first)
+            boundary = (self.cycle // self.interval + 1) * self.interval
+            self.cpu.run(min(boundary, target) - self.cycle)
+            if self.cycle == boundary:
+                self._save(boundary)
+        return cycles
+
+    def goto(self, cycle):
+        """
+        Puts the machine in the exact state it was in (or will be in) at a cycle
+            - Accepts the cycle, anything below 0 goes to the start and anything past now runs forward to it
+            - Raises IndexError if running forward faults
+            - Returns the cycle the machine is now on
+        """
+        cycle = max(cycle, 0)
+        if cycle < self.cycles[-1]:
+            # too far back for the undo log, restore the nearest snapshot and replay from there
+            i = bisect.bisect_right(self.cycles, cycle) - 1
+            start, state, program = self.snapshots[i]
+            del self.snapshots[i + 1:], self.cycles[i + 1:]
+            if program is not self.cpu.program:
+                self.cpu.load_program(program)
+                self._untimed = self.cpu.decoded
+                self._wrap()
+            self.cpu.registers[:] = state[:15]
+            self.cpu.clock = state[15]
+            del self.undo[:]
+        if cycle > self.cycle:
+            self.run(cycle - self.cycle)
+
+        regs = self.cpu.registers
+        while self.cycle > cycle:
+            record = self.undo.pop()
+            dest = (record >> 4) & 0xF
+            if dest != 15:
+                regs[dest] = record >> 8
+            self.cpu.clock = record & 0xF
+        return self.cycle
+
+    def back(self, cycles):
+        """Goes back some number of cycles (see `goto`), returns the cycle the machine is now on."""
+        return self.goto(self.cycle - cycles)
+
+# ========================== Batch Execution ==========================
+def _batch_op(op, regs, rows, v1, v2):
+    """
+    Applies one (non-jump) opcode to a group of machines at once
+        - Accepts the opcode, the (N, 16) register array, the machines (rows) that are executing it and their two values
+        - Does exactly what the matching ALU function does, just on every row in one go
+        - Returns nothing
+            - output is written into the register array
+    """
+    if op == 0:     # add
+        regs[rows, 0] = (regs[rows, v1] + regs[rows, v2]) % 16
+    elif op == 1:   # sub
+        regs[rows, 0] = (regs[rows, v1] - regs[rows, v2]) % 16
+    elif op == 2:   # move
+        regs[rows, v2] = regs[rows, v1]
+    elif op == 3:   # immediate
+        regs[rows, v1] = v2 & 0xF
+    elif op == 5:   # and
+        regs[rows, 0] = regs[rows, v1] & regs[rows, v2]
+    elif op == 6:   # or
+        regs[rows, 0] = regs[rows, v1] | regs[rows, v2]
+    elif op == 7:   # not
+        regs[rows, v2] = ~regs[rows, v1] & 0xF
+
+def run_batch(programs, max_cycles, registers=None, clocks=None, backend=None):
+    """
+    Runs many independent machines side by side, one cycle for all of them at a time
+        - Accepts N programs of 16 words each, a cycle budget, and optionally N sets of 15 starting registers and N starting clocks
+        - Accepts which backend to use: "numpy", or "swar" which needs nothing but python (numpy if it's installed, swar if not)
+        - Every cycle each machine runs the word its own clock points at, the same as `CPU.step`
+            - machines are grouped by opcode and each group is handled with one array operation
+            - a machine that touches R15 (which doesn't exist) is stopped before that word and marked as faulted
+        - Returns a dict with the final `registers` (N, 15), `clocks` (N,), `cycles` run by each machine (N,) and `faulted` (N,)
+            - numpy arrays from the numpy backend, lists from the swar one
+    """
+    if backend is None:
+        backend = "swar" if np is None else "numpy"
+    if backend == "swar":
+        return run_batch_swar(programs, max_cycles, registers, clocks)
+    if backend != "numpy":
+        raise ValueError(f"unknown batch backend {backend!r} (numpy or swar)")
+    if np is None:
+        raise ImportError("the numpy batch backend needs numpy (pip install numpy), use backend=\"swar\" without it")
+
+    programs = np.asarray(programs, dtype=np.uint16).reshape(-1, 16)
+    n = len(programs)
+    regs = np.zeros((n, 16), dtype=np.uint8)    # one spare column so R15 can be looked up, machines never get to use it
+    if registers is not None:
+        regs[:, :15] = np.asarray(registers, dtype=np.uint8).reshape(n, 15) & 0xF
+    clk = np.zeros(n, dtype=np.uint8) if clocks is None else np.asarray(clocks, dtype=np.uint8).reshape(n) & 0xF
+
+    # decode every word of every program once up front
+    ops = (programs >> 8).astype(np.uint8)
+    val1 = ((programs >> 4) & 0xF).astype(np.uint8)
+    val2 = (programs & 0xF).astype(np.uint8)
+    bad = np.where(ops == 3, val1 == 15, np.where(ops == 4, val2 == 15, (val1 == 15) | (val2 == 15)))  # same rule as `register_operands`
+
+    lanes = np.arange(n)
+    cycles = np.zeros(n, dtype=np.int64)
+    faulted = np.zeros(n, dtype=bool)
+    active = np.ones(n, dtype=bool)
+
+    for _ in range(max_cycles):
+        hit = active & bad[lanes, clk]
+        if hit.any():
+            faulted |= hit
+            active &= ~hit
+            if not active.any():
+                break
+
+        op, v1, v2 = ops[lanes, clk], val1[lanes, clk], val2[lanes, clk]
+        nxt = (clk + 1) & 0xF
+        for code in range(8):
+            rows = np.flatnonzero(active & (op == code))
+            if rows.size == 0:
+                continue
+            if code == 4:   # jump if zero only changes where the clock goes next
+                jumped = rows[regs[rows, v2[rows]] == 0]
+                nxt[jumped] = v1[jumped]
+            else:
+                _batch_op(code, regs, rows, v1[rows], v2[rows])
+
+        clk = np.where(active, nxt, clk)
+        cycles += active
+
+    return {"registers": regs[:, :15].copy(), "clocks": clk, "cycles": cycles, "faulted": faulted}
+
+# SWAR ("SIMD within a register"): register r of every machine lives in one python int, 4 bits per machine,
+# machine i in bits 4i to 4i+3, so one operation on the int does it for every machine at once
+def _swar_pack(values):
+    """Packs a list of 4-bit values (one per machine) into one int."""
+    if len(values) % 2:
+        values = list(values) + [0]
+    return int.from_bytes(bytes((values[i] & 0xF) | (values[i + 1] & 0xF) << 4 for i in range(0, len(values), 2)), "little")
+
+def _swar_unpack(packed, n):
+    """Unpacks an int back into a list of n 4-bit values."""
+    data = packed.to_bytes((n + 1) // 2, "little")
+    return [(data[i >> 1] >> (i & 1) * 4) & 0xF for i in range(n)]
+
+def _swar_op(op, regs, v1, v2, lanes, ones):
+    """
+    Applies one (non-jump) opcode to every machine in `lanes` at once
+        - Accepts the opcode, the list of 15 packed registers, the two values, a mask with 1111 in every lane
+          that's executing it, and a mask with 0001 in every lane
+        - Does exactly what the matching ALU function does, lane by lane:
+            - add and sub keep the top bit of every lane out of the arithmetic so a carry or borrow never
+              crosses into the next machine, then put it back with an xor
+            - and, or and not are already lane by lane
+        - Returns nothing
+            - output is merged into the registers, lanes outside `lanes` keep what they had
+    """
+    if op == 0:     # add
+        a, b = regs[v1], regs[v2]
+        low = ones * 7
+        result, dest = ((a & low) + (b & low)) ^ ((a ^ b) & ones * 8), 0
+    elif op == 1:   # sub
+        a, b = regs[v1], regs[v2]
+        high = ones * 8
+        result, dest = ((a | high) - (b & ones * 7)) ^ ((a ^ b ^ high) & high), 0
+    elif op == 2:   # move
+        result, dest = regs[v1], v2
+    elif op == 3:   # immediate
+        result, dest = ones * (v2 & 0xF), v1
+    elif op == 5:   # and
+        result, dest = regs[v1] & regs[v2], 0
+    elif op == 6:   # or
+        result, dest = regs[v1] | regs[v2], 0
+    else:           # not
+        result, dest = regs[v1] ^ ones * 15, v2
+    old = regs[dest]
+    regs[dest] = old ^ ((old ^ result) & lanes)
+
+_swar_min_machines = 32  # programs run by fewer machines than this are run one machine at a time instead
+
+def run_batch_swar(programs, max_cycles, registers=None, clocks=None):
+    """
+    The pure python batch backend (see `run_batch`), everything is done with big ints instead of numpy arrays
+        - Machines are grouped by program first, every program run by at least `_swar_min_machines` machines
+          gets its own packed run (see `_swar_run`)
+        - The rest are run one at a time with `CPU.fast_forward`, a packed run only pays off when lots of machines share it
+        - Returns the same dict as `run_batch`, with lists instead of arrays
+    """
+    programs = [tuple(int(word) for word in program) + (0,)*(16 - len(program)) for program in programs]
+    n = len(programs)
+    rows = [[0]*15]*n if registers is None else [[int(value) & 0xF for value in row] for row in registers]
+    clk = [0]*n if clocks is None else [int(c) & 0xF for c in clocks]
+
+    sharing = {}    # program -> the machines running it
+    for lane, program in enumerate(programs):
+        sharing.setdefault(program, []).append(lane)
+
+    result = {"registers": [None]*n, "clocks": [0]*n, "cycles": [max_cycles]*n, "faulted": [False]*n}
+    for program, lanes in sharing.items():
+        if len(lanes) >= _swar_min_machines:
+            packed = _swar_run(program, [rows[lane] for lane in lanes], [clk[lane] for lane in lanes], max_cycles)
+            for key, values in packed.items():
+                for lane, value in zip(lanes, values):
+                    result[key][lane] = value
+            continue
+        for lane in lanes:
+            cpu = CPU(program, rows[lane])
+            cpu.clock = clk[lane]
+            loop = cpu.fast_forward(max_cycles)     # a fault leaves the machine in front of the bad word, like a packed run
+            result["registers"][lane] = list(cpu.registers)
+            result["clocks"][lane] = cpu.clock
+            result["cycles"][lane] = loop["cycles"]
+            result["faulted"][lane] = loop["verdict"] == "fault"
+    return result
+
+def _swar_run(program, rows, clocks, max_cycles):
+    """
+    Runs one program on many machines at once
+        - Accepts 16 words, a list of 15 registers and a clock for every machine, and the cycle budget
+        - Each register is one int with a lane per machine (see `_swar_op`), and for every address there's a mask
+          of which machines' clocks are on it
+        - Every cycle, the machines at each address are one group, and each group is a handful of int operations
+          however many machines are in it
+        - Returns a dict with a list of `registers`, `clocks`, `cycles` and `faulted` (one entry per machine)
+    """
+    n = len(rows)
+    ones = _swar_pack([1]*n)
+    regs = [_swar_pack([row[r] for row in rows]) for r in range(15)]
+    entries = [decode_word(word) for word in program]
+    faults = [15 in register_operands(*entry) for entry in entries]
+    at = [_swar_pack([15 if c == addr else 0 for c in clocks]) for addr in range(16)]
+
+    stuck = [0]*16  # machines that faulted at each address
+    fault_cycles = []   # (lanes, cycle) for every group that faulted
+    for cycle in range(max_cycles):
+        new = [0]*16
+        for addr in range(16):
+            lanes = at[addr]
+            if not lanes:
+                continue
+            op, v1, v2 = entries[addr]
+            nxt = (addr + 1) & 0xF
+            if faults[addr]:
+                stuck[addr] |= lanes
+                fault_cycles.append((lanes, cycle))
+            elif op == 4:
+                value = regs[v2]
+                nonzero = (value | value >> 1 | value >> 2 | value >> 3) & ones
+                zero = ((ones ^ nonzero) * 15) & lanes
+                new[v1] |= zero
+                new[nxt] |= lanes ^ zero
+            else:
+                _swar_op(op, regs, v1, v2, lanes, ones)
+                new[nxt] |= lanes
+        at = new
+        if not any(at):
+            break
+
+    clocks_out = [0]*n
+    for addr in range(16):
+        for lane, bits in enumerate(_swar_unpack(at[addr] | stuck[addr], n)):
+            if bits:
+                clocks_out[lane] = addr
+    cycles = [max_cycles]*n
+    faulted = [False]*n
+    for lanes, cycle in fault_cycles:
+        for lane, bits in enumerate(_swar_unpack(lanes, n)):
+            if bits:
+                cycles[lane], faulted[lane] = cycle, True
+    unpacked = [_swar_unpack(packed, n) for packed in regs]
+    return {"registers": [[unpacked[r][lane] for r in range(15)] for lane in range(n)],
+            "clocks": clocks_out, "cycles": cycles, "faulted": faulted}
+
+# ========================== Result Cache ==========================
+class ResultCache:
+    """
+    Remembers what programs end up doing, since the same program from the same registers always ends up the same way
+        - Results are keyed by a hash of the packed program, the starting registers and clock, and the cycle budget
+        - The most recently used `memory_size` results are kept in a dict, everything else goes in an SQLite file
+            - the file is trimmed back to `disk_size` results (least recently used first) whenever it's flushed
+            - with no path it's just the in-memory part
+        - Any number of processes can share one file, results are written in batches so a sweep isn't waiting on the disk
+    """
+    _columns = "registers, clock, cycles, verdict, pc, start, period"
+
+    def __init__(self, path=None, memory_size=65536, disk_size=1000000, batch=1024):
+        self.memory = OrderedDict()
+        self.memory_size = memory_size
+        self.disk_size = disk_size
+        self.batch = batch
+        self.pending = []   # results not written to the file yet
+        self.touched = []   # (time, key) for every result that was read, so the file knows it was recently used
+        self.hits = 0
+        self.misses = 0
+        self.db = None
+        if path:
+            self.db = sqlite3.connect(path, timeout=60)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute(f"CREATE TABLE IF NOT EXISTS results (key BLOB PRIMARY KEY, {self._columns}, used REAL)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS results_used ON results (used)")
+
+    @staticmethod
+    def key(program, registers=None, max_cycles=0, clock=0):
+        """Returns the 16 byte hash a run is stored under."""
+        program = tuple(program) + (0,)*(16 - len(program))
+        registers = bytes(15) if registers is None else bytes(registers)
+        return hashlib.blake2b(pack_image(program) + registers + bytes((clock,)) + max_cycles.to_bytes(16, "little"),
+                               digest_size=16).digest()
+
+    def get(self, key):
+        """Returns the result stored for a key (a new dict every time), or None."""
+        result = self.memory.get(key)
+        if result is not None:
+            self.memory.move_to_end(key)
+        elif self.db:
+            row = self.db.execute(f"SELECT {self._columns} FROM results WHERE key = ?", (key,)).fetchone()
+            if row:
+                result = dict(zip(("registers", "clock", "cycles", "verdict", "pc", "start", "period"), row))
+                result["registers"] = list(result["registers"])
+                self._remember(key, result)
+        if result is None:
+            return None
+        if self.db:
+            # hits from memory count too, otherwise the results used most would look the oldest in the file
+            self.touched.append((time.time(), key))
+            if len(self.touched) >= self.batch:
+                self.flush()
+        return dict(result, registers=list(result["registers"]))
+
+    def put(self, key, result):
+        """Stores a result (a dict like the one `run` returns) under a key."""
+        self._remember(key, result)
+        if self.db:
+            self.pending.append((key, bytes(result["registers"]), result["clock"], result["cycles"], result["verdict"],
+                                 result["pc"], result["start"], result["period"], time.time()))
+            if len(self.pending) >= self.batch:
+                self.flush()
+
+    def _remember(self, key, result):
+        """Puts a result in the in-memory part, dropping the least recently used one if it's full."""
+        self.memory[key] = result
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.memory_size:
+            self.memory.popitem(last=False)
+
+    def run(self, program, registers=None, max_cycles=0, clock=0):
+        """
+        Works out where a program ends up after a number of cycles, only running it if it's never been run before
+            - Accepts the program, the starting registers (zeros if None), the cycle budget and the starting clock
+            - Runs it with `CPU.fast_forward`, so the answer is exact however big the budget is
+            - Returns a dict with the final `registers` and `clock` plus the `verdict`, `pc`, `start`, `period` and `cycles`
+        """
+        key = self.key(program, registers, max_cycles, clock)
+        result = self.get(key)
+        if result is not None:
+            self.hits += 1
+            return result
+        self.misses += 1
+
+        cpu = CPU(program, registers)
+        cpu.clock = clock
+        result = cpu.fast_forward(max_cycles)
+        result.update(registers=list(cpu.registers), clock=cpu.clock)
+        self.put(key, result)
+        return dict(result, registers=list(result["registers"]))
+
+    def flush(self):
+        """Writes every pending result to the file and trims it back to `disk_size`."""
+        if not self.db:
+            return
+        with self.db:
+            self.db.executemany(f"INSERT OR REPLACE INTO results (key, {self._columns}, used) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                self.pending)
+            self.db.executemany("UPDATE results SET used = ? WHERE key = ?", self.touched)
+            self.pending, self.touched = [], []
+            extra = self.db.execute("SELECT COUNT(*) FROM results").fetchone()[0] - self.disk_size
+            if extra > 0:
+                self.db.execute("DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY used LIMIT ?)", (extra,))
+
+    def close(self):
+        """Flushes and closes the file."""
+        if self.db:
+            self.flush()
+            self.db.close()
+            self.db = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# ========================== Program Images ==========================
+# a binary image is an 8 byte header followed by one or more 22 byte records, one record per program
+#   header: "LEG4", format version, flags (unused, 0), record size (little-endian 16-bit)
+#   record: the 16 words packed back to back, 11 bits each, P0 first in the most significant bits (176 bits = 22 bytes)
+# a single program and a corpus of millions are the same format, a corpus just has more records
+_image_magic = b"LEG4"
+_image_version = 1
+_image_header = struct.Struct("<4sBBH")
+_image_record_size = 22
+
+def pack_image(words):
+    """Packs 16 11-bit words into one 22 byte record."""
+    n = 0
+    for word in words:
+        n = (n << 11) | (word & 0x7FF)
+    return n.to_bytes(_image_record_size, "big")
+
+def unpack_image(record):
+    """Unpacks one 22 byte record (bytes or a memoryview) back into a tuple of 16 words."""
+    n = int.from_bytes(record, "big")
+    return tuple((n >> shift) & 0x7FF for shift in range(165, -1, -11))
+
+def _check_header(header, path):
+    """Raises ValueError if the first bytes of a file aren't a header this version understands."""
+    if len(header) < _image_header.size:
+        raise ValueError(f"{path}: too short to be a program image")
+    magic, version, _, size = _image_header.unpack_from(header)
+    if magic != _image_magic:
+        raise ValueError(f"{path}: not a program image")
+    if version != _image_version or size != _image_record_size:
+        raise ValueError(f"{path}: image version {version} with {size} byte records isn't supported")
+
+def save_image(path, words):
+    """
+    Saves one program as a binary image
+        - Accepts the path and up to 16 words (missing words at the end are zeroed)
+        - Returns nothing
+    """
+    words = tuple(words) + (0,)*(16 - len(words))
+    with open(path, "wb") as f:
+        f.write(_image_header.pack(_image_magic, _image_version, 0, _image_record_size) + pack_image(words))
+
+def load_image(path):
+    """
+    Loads a program from a binary image
+        - Accepts the path (if the file has more than one record the first is used)
+        - Raises ValueError if the file isn't an image or is empty
+        - Returns a tuple of 16 words
+    """
+    with open(path, "rb") as f:
+        data = f.read(_image_header.size + _image_record_size)
+    _check_header(data, path)
+    if len(data) < _image_header.size + _image_record_size:
+        raise ValueError(f"{path}: image has no programs in it")
+    return unpack_image(data[_image_header.size:])
+
+def write_corpus(path, programs):
+    """
+    Writes any number of programs into one image file
+        - Accepts the path and an iterable of programs (each up to 16 words), which is only walked through once
+        - Returns the number of programs written
+    """
+    count = 0
+    with open(path, "wb", buffering=1 << 20) as f:
+        f.write(_image_header.pack(_image_magic, _image_version, 0, _image_record_size))
+        for words in programs:
+            f.write(pack_image(tuple(words) + (0,)*(16 - len(words))))
+            count += 1
+    return count
+
+class Corpus:
+    """
+    A memory-mapped image file with any number of programs in it
+        - Nothing is read until it's used, and records are handed out as memoryviews straight into the mapping (no copies)
+        - `corpus[i]` is the raw record, `corpus.program(i)` the decoded words, `len(corpus)` the number of programs
+        - `array()` decodes every program at once into an (N, 16) numpy array, ready for `run_batch`
+        - Use it as a context manager (or call `close`), every memoryview handed out has to be let go of first
+    """
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:   # empty files can't be mapped
+            self._file.close()
+            raise ValueError(f"{path}: too short to be a program image")
+        try:
+            _check_header(self._map, path)
+        except ValueError:
+            self._map.close()
+            self._file.close()
+            raise
+        self._view = memoryview(self._map)
+        self.records = self._view[_image_header.size:]
+        self.count = len(self.records) // _image_record_size
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if not 0 <= i < self.count:
+            raise IndexError("corpus index out of range")
+        start = i * _image_record_size
+        return self.records[start:start + _image_record_size]
+
+    def __iter__(self):
+        for start in range(0, self.count * _image_record_size, _image_record_size):
+            yield self.records[start:start + _image_record_size]
+
+    def program(self, i):
+        """Returns program i as a tuple of 16 words."""
+        return unpack_image(self[i])
+
+    def programs(self):
+        """Yields every program as a tuple of 16 words."""
+        for record in self:
+            yield unpack_image(record)
+
+    def array(self):
+        """Returns every program as an (N, 16) uint16 numpy array of words (needs numpy)."""
+        if np is None:
+            raise ImportError("Corpus.array needs numpy (pip install numpy)")
+        raw = np.frombuffer(self._map, dtype=np.uint8, count=self.count * _image_record_size, offset=_image_header.size)
+        bits = np.unpackbits(raw.reshape(self.count, _image_record_size), axis=1).reshape(self.count, 16, 11)
+        del raw
+        return (bits.astype(np.uint16) << np.arange(10, -1, -1, dtype=np.uint16)).sum(axis=2, dtype=np.uint16)
+
+    def close(self):
+        """Unmaps the file."""
+        self.records.release()
+        self._view.release()
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# ========================== Assembler ==========================
+# one instruction per line, the mnemonic then its two values in the same order as the binary fields, e.g.
+#   loop:   IMMD R1, 5          # registers are R0 to R15 (R15 doesn't exist, using it faults like it does in binary)
+#           ADD R1, R2          # numbers can be decimal, 0b binary or 0x hex (0 to 15)
+#           JMP_IF_ZERO loop, R0    # the address can be a number or a label
+# mnemonics are the ones from the readme (any case), comments start with `#` or `;`
+_label_chars = set("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_")
+
+def _parse_number(text):
+    """Turns a decimal, 0b or 0x number into an int, returns None if it isn't one."""
+    try:
+        return int(text, 0)
+    except ValueError:
+        return None
+
+def assemble(source, name="<source>"):
+    """
+    Assembles a program written with mnemonics
+        - Accepts the source text and a name to put in error messages (usually the file name)
+        - Labels (`name:`) can go on their own line or in front of an instruction, and can be used before they're defined
+        - Raises ValueError with the line number for anything it doesn't understand or if there are more than 16 instructions
+        - Returns the list of 11-bit words, ready for `CPU.load_program`
+    """
+    labels = {}
+    lines = []  # (line number, mnemonic, operands) for every instruction, labels are filled in afterwards
+    for line_no, line in enumerate(source.splitlines(), 1):
+        line = line.split("#", 1)[0].split(";", 1)[0].strip()
+        while ":" in line:
+            label, _, line = line.partition(":")
+            label, line = label.strip(), line.strip()
+            if not label or label[0].isdigit() or any(c not in _label_chars for c in label):
+                raise ValueError(f"{name}:{line_no}: bad label {label!r}")
+            if label in labels:
+                raise ValueError(f"{name}:{line_no}: label {label!r} is already defined")
+            labels[label] = len(lines)
+        if not line:
+            continue
+        mnemonic, rest = (line.split(None, 1) + [""])[:2]
+        operands = [operand.strip() for operand in rest.split(",")] if rest.strip() else []
+        lines.append((line_no, mnemonic.upper(), operands))
+
+    if len(lines) > 16:
+        raise ValueError(f"{name}: program has {len(lines)} instructions, memory only holds 16")
+
+    words = []
+    for line_no, mnemonic, operands in lines:
+        if mnemonic not in _op_names:
+            raise ValueError(f"{name}:{line_no}: unknown instruction {mnemonic!r}")
+        op = _op_names.index(mnemonic)
+        if len(operands) != 2:
+            raise ValueError(f"{name}:{line_no}: {mnemonic} takes two values")
+        kinds = {3: ("a register", "a number"), 4: ("an address", "a register")}.get(op, ("a register", "a register"))
+        values = []
+        for kind, operand in zip(kinds, operands):
+            if kind == "a register":
+                value = _parse_number(operand[1:]) if operand[:1] in "rR" and operand[1:].isdigit() else None
+            elif kind == "an address" and operand in labels:
+                value = labels[operand]
+            else:
+                value = _parse_number(operand)
+            if value is None or not 0 <= value <= 15:
+                raise ValueError(f"{name}:{line_no}: expected {kind} (0 to 15) not {operand!r}")
+            values.append(value)
+        words.append(encode_word(op, *values))
+    return words
+
+def disassemble(words, labels=True, trim=True):
+    """
+    Turns words back into assembly that `assemble` gives the same words for
+        - Accepts up to 16 11-bit words, whether to name jump targets (L0 to L15) instead of using numbers
+          and whether to leave zero words off the end
+        - Zero words at the end are left off since memory starts zeroed anyway, unless something jumps there
+            - a jump past the last word that was passed in keeps its number, a label there would end up on the wrong address
+        - Returns the source text
+    """
+    words = list(words)
+    targets = {(word >> 4) & 0xF for word in words if word >> 8 == 4} if labels else set()
+    end = len(words)
+    while trim and end and words[end - 1] == 0 and end - 1 not in targets:
+        end -= 1
+    targets = {target for target in targets if target < end}
+
+    lines = []
+    for addr, word in enumerate(words[:end]):
+        op, v1, v2 = decode_word(word)
+        if op == 3:
+            values = f"R{v1}, {v2}"
+        elif op == 4:
+            values = f"{f'L{v1}' if v1 in targets else v1}, R{v2}"
+        else:
+            values = f"R{v1}, R{v2}"
+        label = f"L{addr}:" if addr in targets else ""
+        lines.append(f"{label:<8}{_op_names[op]} {values}")
+    return "\n".join(lines) + "\n"
+
+# ========================== Static Analysis ==========================
+# what counts as the program's behaviour here: every observed register whenever a jump that can go somewhere runs,
+# whenever the machine goes from P15 back round to P0, and wherever it faults, starting from P0 with any registers
+# anything that only changes registers in between those points can be rewritten
+
+def _noop(word, addr):
+    """True for a jump to the very next address, which goes there whether it jumps or not (unless it's on R15)."""
+    return word >> 8 == 4 and (word >> 4) & 0xF == (addr + 1) & 0xF and word & 0xF != 15
+
+def _transfer(word, state):
+    """
+    Works out which registers are known after one word
+        - Accepts the word and a tuple of 15 known values (None where the value could be anything)
+        - Returns the tuple after the word has run
+    """
+    op, v1, v2 = decode_word(word)
+    if 15 in register_operands(op, v1, v2) or op == 4:
+        return state
+    a, b = state[v1], state[v2] if op != 3 else v2
+    if op == 0:
+        value, dest = (None if a is None or b is None else (a + b) % 16), 0
+    elif op == 1:
+        value, dest = (0 if v1 == v2 else None if a is None or b is None else (a - b) % 16), 0
+    elif op == 2:
+        value, dest = a, v2
+    elif op == 3:
+        value, dest = v2, v1
+    elif op == 5:
+        value, dest = (0 if 0 in (a, b) else None if a is None or b is None else a & b), 0
+    elif op == 6:
+        value, dest = (15 if 15 in (a, b) else None if a is None or b is None else a | b), 0
+    else:
+        value, dest = (None if a is None else ~a & 0xF), v2
+    return state[:dest] + (value,) + state[dest + 1:]
+
+def successors(program, addr, state=None):
+    """
+    Returns the addresses that can run after one word
+        - Accepts the program, the address and optionally the known registers going into it (see `propagate_constants`)
+            - a jump on a register that's known is only followed the one way it can go
+        - Words that fault have no successors
+    """
+    op, v1, v2 = decode_word(program[addr])
+    if 15 in register_operands(op, v1, v2):
+        return ()
+    nxt = (addr + 1) & 0xF
+    if op != 4:
+        return (nxt,)
+    value = None if state is None else state[v2]
+    if value is None:
+        return (v1, nxt) if v1 != nxt else (nxt,)
+    return (v1,) if value == 0 else (nxt,)
+
+def propagate_constants(program):
+    """
+    Finds every register value that's the same every time the machine gets to an address
+        - Accepts 16 words
+        - Returns a list of 16 tuples of 15 values (None where it could be anything), or None for addresses that can't be reached
+    """
+    states = [None]*16
+    states[0] = (None,)*15
+    work = [0]
+    while work:
+        addr = work.pop()
+        after = _transfer(program[addr], states[addr])
+        for nxt in successors(program, addr, states[addr]):
+            merged = after if states[nxt] is None else tuple(a if a == b else None for a, b in zip(states[nxt], after))
+            if merged != states[nxt]:
+                states[nxt] = merged
+                work.append(nxt)
+    return states
+
+def live_registers(program, states, observed, dead=()):
+    """
+    Finds which registers can still matter going into each address
+        - Accepts 16 words, the known values from `propagate_constants`, the observed registers and the addresses
+          already treated as doing nothing
+        - Returns a list of 16 sets of register addresses
+    """
+    observed = set(observed)
+    live = [set() for _ in range(16)]
+    changed = True
+    while changed:
+        changed = False
+        for addr in range(15, -1, -1):
+            if states[addr] is None:
+                continue
+            word = program[addr]
+            op, v1, v2 = decode_word(word)
+            after = set().union(*(live[nxt] for nxt in successors(program, addr, states[addr])))
+            if addr == 15 or (op == 4 and addr not in dead):
+                after |= observed
+            if addr in dead:
+                before = after
+            elif 15 in register_operands(op, v1, v2):
+                before = observed | set(register_operands(op, v1, v2)) - {15}
+            elif op == 4:
+                before = after | {v2}
+            else:
+                before = (after - {register_dest(op, v1, v2)}) | set(register_reads(op, v1, v2))
+            if before != live[addr]:
+                live[addr] = before
+                changed = True
+    return live
+
+def shrink_stretches(program, stretches):
+    """
+    Puts shorter code in place of stretches of straight-line code
+        - Accepts 16 words and a list of (start, stop, kept words) with fewer kept words than the stretch is long
+        - There's no unconditional jump, so the words can't just be cut out: the kept words go at the end of the stretch
+          with jumps to the next address (which never do anything) in front of them
+        - Every jump to the start of a stretch is pointed at its first kept word, so only falling in from above goes
+          through the padding (never straight round to P0 though, that would skip passing P15)
+        - Returns the new 16 words and a dict of old stretch start -> where its first kept word is now
+    """
+    new = list(program)
+    moved = {}
+    replaced = set()
+    for start, stop, kept in stretches:
+        skip = stop - start - len(kept)
+        new[start:stop] = [encode_word(4, (addr + 1) & 0xF, 0) for addr in range(start, start + skip)] + list(kept)
+        moved[start] = min(start + skip, 15)
+        replaced.update(range(start, stop))
+    for addr, word in enumerate(program):
+        target = (word >> 4) & 0xF
+        if word >> 8 == 4 and addr not in replaced and target in moved:
+            new[addr] = encode_word(4, moved[target], word & 0xF)
+    return new, moved
+
+def peephole(program, observed=range(15)):
+    """
+    Folds constants and removes instructions nothing can see the result of
+        - Accepts up to 16 words and the registers whose values count as the program's output (all of them by default)
+        - Steps:
+            - a word whose result is always the same number becomes an IMMD of that number
+            - jumps that can never be taken, and jumps to the next address, do nothing
+            - a word whose result is overwritten before it's read or observed does nothing (repeated until nothing else goes)
+            - the words left in each stretch without jumps are moved to the end of it (see `shrink_stretches`)
+        - Stretches with a word that touches R15 are left alone (jumps in them included) so they fault in exactly the same place
+        - Returns the new 16 words and a dict with the `folded` and `removed` addresses, and the cycles per trip around
+          every `loop` (start, jump address, before, after)
+    """
+    program = list(program) + [0]*(16 - len(program))
+    states = propagate_constants(program)
+
+    folded = []
+    for addr, word in enumerate(program):
+        op, v1, v2 = decode_word(word)
+        if states[addr] is None or op in (3, 4) or 15 in register_operands(op, v1, v2):
+            continue
+        dest = register_dest(op, v1, v2)
+        value = _transfer(word, states[addr])[dest]
+        if value is not None:
+            program[addr] = encode_word(3, dest, value)
+            folded.append(addr)
+
+    # a jump that never does anything only goes away with its stretch, so if the stretch has to be left alone
+    # the jump is kept (its register read counts) and everything is worked out again, e.g. in
+    # IMMD R1,11 / JMP_IF_ZERO 5,R5 / JMP_IF_ZERO 5,R1 / IMMD R15,1 ... the IMMD is what keeps P2 from jumping past the fault
+    kept_jumps = set()
+    while True:
+        dead = {addr for addr in range(16) if states[addr] is not None and program[addr] >> 8 == 4
+                and addr not in kept_jumps
+                and (_noop(program[addr], addr) or len(successors(program, addr, states[addr])) == 1
+                     and successors(program, addr, states[addr])[0] == (addr + 1) & 0xF)}
+        while True:
+            live = live_registers(program, states, observed, dead)
+            more = set()
+            for addr, word in enumerate(program):
+                op, v1, v2 = decode_word(word)
+                if states[addr] is None or addr in dead or op == 4 or 15 in register_operands(op, v1, v2):
+                    continue
+                dest = register_dest(op, v1, v2)
+                after = set().union(*(live[nxt] for nxt in successors(program, addr, states[addr])))
+                if addr == 15:
+                    after |= set(observed)
+                if dest not in after:
+                    more.add(addr)
+            if not more:
+                break
+            dead |= more
+
+        # stretches run from a jump target (or P0, or just after a jump) up to the next jump that stays or jump target
+        jumps = {addr for addr in range(16) if states[addr] is not None and program[addr] >> 8 == 4 and addr not in dead}
+        targets = {(program[addr] >> 4) & 0xF for addr in jumps}
+        stretches = []
+        removed = []
+        stuck = set()
+        start = 0
+        for addr in range(17):
+            if addr == 16 or addr in jumps or (addr in targets and addr != start):
+                stretch = range(start, addr)
+                gone = [a for a in stretch if a in dead]
+                if gone and all(15 not in register_operands(*decode_word(program[a])) for a in stretch):
+                    stretches.append((start, addr, [program[a] for a in stretch if a not in dead]))
+                    removed += gone
+                else:
+                    stuck |= {a for a in gone if program[a] >> 8 == 4}
+                start = addr + 1 if addr in jumps else addr
+        if not stuck:
+            break
+        kept_jumps |= stuck
+    new, moved = shrink_stretches(program, stretches)
+
+    loops = []
+    for addr in sorted(jumps):
+        target = (program[addr] >> 4) & 0xF
+        if target <= addr and target in successors(program, addr, states[addr]):
+            loops.append((target, addr, addr - target + 1, addr - moved.get(target, target) + 1))
+    # anything folded in a stretch that was left alone is still folded (it does exactly the same thing)
+    return new, {"folded": folded, "removed": removed, "loops": loops}
 
 # ========================== Program Execution ==========================
 def program():
@@ -292,55 +1944,304 @@ def program():
         user_input = get_user_input()
         if user_input is None:  # really means if 'end' is input
             break
-        _program[i] = int_to_bits(user_input[0], 3) + int_to_bits(user_input[1], 4) + int_to_bits(user_input[2], 4)
-        increment_clk()
+        _cpu.write_word(i, encode_word(*user_input))
+        _cpu.increment_clk()
 
     # reset clock and end program mode
-    _clock[:] = [0]*4
+    _cpu.clock = 0
     _prg_mode = False
 
+def read_program_file(path):
+    """
+    Reads a program from a text file (or a binary image, see `save_image`, or assembly, see `assemble`)
+        - Accepts the path to a file with one word per line in the same format as user input (`011 0001 0101`)
+            - blank lines and anything after a `#` are ignored
+            - files ending in `.asm` are assembled instead
+        - Raises ValueError if a line is not a valid word or there are more than 16 words
+        - Returns the list of 11-bit words, ready for `CPU.load_program`
+    """
+    with open(path, "rb") as f:
+        if f.read(len(_image_magic)) == _image_magic:
+            return list(load_image(path))
+    if path.endswith(".asm"):
+        with open(path) as f:
+            return assemble(f.read(), path)
+
+    words = []
+    with open(path) as f:
+        for line_no, line in enumerate(f, 1):
+            parts = line.split("#", 1)[0].split()
+            if not parts:
+                continue
+            if len(parts) != 3 or len(parts[0]) != 3 or len(parts[1]) != 4 or len(parts[2]) != 4 or any(c not in "01" for c in "".join(parts)):
+                raise ValueError(f"{path}:{line_no}: expected OPCODE (3-bit) INPUT1 (4-bit) INPUT2 (4-bit)")
+            words.append(encode_word(int(parts[0], 2), int(parts[1], 2), int(parts[2], 2)))
+
+    if len(words) > 16:
+        raise ValueError(f"{path}: program has {len(words)} words, memory only holds 16")
+    return words
+
+class Snapshot:
+    """A frozen copy of a machine's state for the ui to draw, made by `ClockThread` after every batch of cycles."""
+    __slots__ = ("registers", "clock", "program", "cycles")
+
+    def __init__(self, cpu, cycles):
+        self.registers = bytes(cpu.registers)
+        self.clock = cpu.clock
+        self.program = cpu.program
+        self.cycles = cycles
+
+class ClockThread:
+    """
+    Runs a machine on its own thread, either at a set clock rate or as fast as possible
+        - The ui never touches the machine, it just reads `snapshot` whenever it wants to draw
+            - so how often the screen is drawn has nothing to do with how fast the machine runs
+        - At a set rate the cycles that are due are run in one go, so a fast clock doesn't mean a sleep per cycle
+        - If the program faults (touches R15) the thread stops and keeps the error in `error`
+    """
+    def __init__(self, cpu, hz=None):
+        self.cpu = cpu
+        self.hz = hz
+        self.cycles = 0
+        self.snapshot = Snapshot(cpu, 0)
+        self.error = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+
+    def start(self):
+        """Starts running the machine."""
+        self._thread.start()
+
+    def stop(self):
+        """Stops the machine after the batch it is on and waits for the thread to finish."""
+        self._stop.set()
+        self._thread.join()
+
+    @property
+    def running(self):
+        return self._thread.is_alive()
+
+    def _loop(self):
+        """
+        The body of the thread
+            - Works out how many cycles should have run by now, runs them and publishes a new snapshot
+            - Returns when stopped or when the program faults
+        """
+        start = time.perf_counter()
+        while not self._stop.is_set():
+            if self.hz is None:
+                batch = _check_interval
+            else:
+                elapsed = time.perf_counter() - start
+                batch = min(int(elapsed * self.hz) - self.cycles, _check_interval)
+                if batch <= 0:
+                    # nothing is due yet, wait for the next cycle (or for stop)
+                    self._stop.wait((self.cycles + 1) / self.hz - elapsed)
+                    continue
+
+            try:
+                self.cycles += self.cpu.run(batch)
+            except IndexError as e:
+                self.error = e
+                return
+            finally:
+                self.snapshot = Snapshot(self.cpu, self.cycles)
+
 def run():
     """
     Runs the program stored in memory
         - Accepts no values
-        - Passes the values stored in the program array as the input to the cpu (opcode, value1, value2)
+        - The machine runs at `_run_speed` on its own thread while the screen is redrawn `_frame_rate` times a second
+        - Runs until ctrl+c (or until the program faults), then goes back to the prompt
         - Returns nothing
     """
-    global cycle    # include global var
+    # reset clock
+    _cpu.clock = 0
+    clock = ClockThread(_cpu, _run_speed)
+
+    # draw the whole ui once, after that only the values that change are redrawn
+    renderer = Renderer()
+    renderer.draw(_cpu)
+    clock.start()
+
+    last_time, last_cycles = time.perf_counter(), 0
+    try:
+        while clock.running:
+            time.sleep(1 / _frame_rate)
+            snapshot = clock.snapshot
+            renderer.update(snapshot)
+
+            now = time.perf_counter()
+            rate = (snapshot.cycles - last_cycles) / (now - last_time)
+            last_time, last_cycles = now, snapshot.cycles
+            renderer.status(f"Cycles: {snapshot.cycles:,}  ({rate:,.0f}/s)  PC: P{snapshot.clock}  (ctrl+c to stop)")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        clock.stop()
+
+    renderer.update(clock.snapshot)
+    if clock.error is not None:
+        renderer.status(f"Stopped at P{_cpu.clock}: R15 doesn't exist")
+        input("\nPress enter to continue")
 
+def run_headless(max_cycles=None, deadline=None, compiled=False, detect_loops=False, fast_forward=False):
+    """
+    Runs the program stored in memory as fast as possible without any ui
+        - Accepts an optional cycle budget and an optional wall-clock deadline in seconds
+            - with neither the program runs until interrupted
+        - Accepts a flag to run the program through `compile_program` instead of the interpreter
+        - Accepts a flag to stop as soon as the program halts or starts looping (see `CPU.find_loop`)
+        - Accepts a flag to skip whole trips around a loop instead of running them (see `CPU.run`)
+        - Resets the clock and executes the same way `run` does, just without clearing, printing or sleeping
+        - Returns a dict with the final registers and clock plus the cycles executed, elapsed time and instructions per second
+            - with `detect_loops` it also has the `verdict`, `pc`, `start` and `period` from `CPU.find_loop`
+    """
     # reset clock
-    _clock[:] = [0]*4
-    speed = _run_speed / 10 # convert from Hz to seconds
+    _cpu.clock = 0
+    start = time.perf_counter()
+    if detect_loops:
+        loop = _cpu.find_loop(max_cycles, deadline)
+        cycles = loop["cycles"]
+    else:
+        loop = {}
+        cycles = _cpu.run(max_cycles, deadline, compiled, fast_forward)
+    elapsed = time.perf_counter() - start
 
-    while True:
-        # ui
-        clear_screen()
-        print_ui()
-        
-        # get address and split up it's values by opcode and value1 and value2
-        addr = bits_to_int(_clock)
-        op, v1, v2 = bits_to_int(_program[addr][:3]), bits_to_int(_program[addr][3:7]), bits_to_int(_program[addr][7:])
-        if not process_opcode(op, v1, v2):
-            increment_clk()
-        
-        # wait the correct amount of time
-        time.sleep(speed)
+    return {
+        "registers": list(_cpu.registers),
+        "clock": _cpu.clock,
+        "cycles": cycles,
+        "elapsed": elapsed,
+        "ips": cycles / elapsed if elapsed > 0 else 0.0,
+        **loop,
+    }
 
 # ========================== UI Functions ==========================
-def print_ui():
+_nibble_text = tuple(f"{n:04b}" for n in range(16))     # every register value already formatted
+_word_text = tuple(f"{w:011b}" for w in range(2048))    # every program word already formatted
+
+class Renderer:
+    """
+    Draws the register/program table once and then only rewrites the values that changed
+        - Uses ANSI escape codes to jump the cursor straight to a value, so nothing has to be cleared or reprinted
+        - Lines up with the table from `print_ui`, just with spaces instead of tabs so every column is in a known place
+    """
+    header = "--------Registers-------Program--------"
+    reg_col = 11    # column (counting from 1) every register value starts at
+    prog_col = 26   # column every program word starts at
+    rows = 18       # header + 16 rows + footer, the cursor is parked just under them after every update
+
+    def __init__(self, out=None):
+        self.out = sys.stdout if out is None else out
+        self.registers = None   # what is currently on screen
+        self.clock = None
+        self.program = None
+
+    def table_lines(self, cpu):
+        """Returns the lines of the whole table for a machine."""
+        lines = [self.header]
+        for i in range(16):
+            label = f"R{i}" if i < 15 else "CLK"
+            value = cpu.registers[i] if i < 15 else cpu.clock
+            lines.append(f"| {label:<6}| {_nibble_text[value]} | {'P' + str(i):<6}| {_word_text[cpu.program[i]]} |")
+        lines.append("-"*len(self.header))
+        return lines
+
+    def draw(self, cpu):
+        """
+        Clears the screen and draws the whole table
+            - Accepts the machine to show
+            - Returns nothing
+        """
+        self.out.write("\x1b[2J\x1b[H" + "\n".join(self.table_lines(cpu)) + "\n")
+        self.out.flush()
+        self.registers = bytes(cpu.registers)
+        self.clock = cpu.clock
+        self.program = cpu.program
+
+    def update(self, cpu):
+        """
+        Rewrites only the values that are different from what is on screen
+            - Accepts the machine to show (the same one that was drawn)
+            - Returns nothing
+        """
+        parts = []
+        regs = cpu.registers
+        if regs != self.registers:
+            for i in range(15):
+                if regs[i] != self.registers[i]:
+                    parts.append(f"\x1b[{i + 2};{self.reg_col}H{_nibble_text[regs[i]]}")
+            self.registers = bytes(regs)
+        if cpu.clock != self.clock:
+            parts.append(f"\x1b[17;{self.reg_col}H{_nibble_text[cpu.clock]}")
+            self.clock = cpu.clock
+        if cpu.program is not self.program:
+            for i in range(16):
+                if cpu.program[i] != self.program[i]:
+                    parts.append(f"\x1b[{i + 2};{self.prog_col}H{_word_text[cpu.program[i]]}")
+            self.program = cpu.program
+
+        if parts:
+            parts.append(f"\x1b[{self.rows + 1};1H")
+            self.out.write("".join(parts))
+            self.out.flush()
+
+    def status(self, text):
+        """Replaces the line just under the table with the given text."""
+        self.out.write(f"\x1b[{self.rows + 1};1H\x1b[K{text}")
+        self.out.flush()
+
+def print_ui(cpu=None):
     """
     Prints the main chunk of UI that shows the state of registers and program memory
-        - Accepts no inputs
+        - Accepts the machine to show (the interactive one if None)
         - Returns nothing
             - instead prints out values
     """
+    if cpu is None:
+        cpu = _cpu
     print("--------Registers-------Program--------")    # add a nice header
     for i in range(15): # print out first 15 registers and memory
-        print(f"| R{i}\t| {''.join(map(str, _registers[i]))} | P{i}\t| {''.join(map(str, _program[i]))} |")
+        print(f"| R{i}\t| {_nibble_text[cpu.registers[i]]} | P{i}\t| {_word_text[cpu.program[i]]} |")
     # need another seperate print so that clock register is correctly labeled
-    print(f"| CLK\t| {''.join(map(str, _clock))} | P15\t| {''.join(map(str, _program[15]))} |")
+    print(f"| CLK\t| {_nibble_text[cpu.clock]} | P15\t| {_word_text[cpu.program[15]]} |")
     print("---------------------------------------")
 
+def print_report(result):
+    """
+    Prints the throughput numbers from a headless run underneath the usual ui
+        - Accepts the dict returned by `run_headless`
+        - Returns nothing
+            - instead prints out values
+    """
+    print_ui()
+    print(f"Cycles executed: {result['cycles']}")
+    print(f"Elapsed time:    {result['elapsed']:.3f}s")
+    print(f"Instructions/s:  {result['ips']:,.0f}")
+
+    verdict = result.get("verdict")
+    if verdict == "halted":
+        print(f"Halted at P{result['pc']} on cycle {result['start']}")
+    elif verdict == "loop":
+        print(f"Entered a loop of period {result['period']} at P{result['pc']} on cycle {result['start']}")
+    elif verdict == "fault":
+        print(f"Faulted at P{result['pc']} (R15 doesn't exist)")
+    elif verdict == "budget":
+        print("No halt or loop found before the budget ran out")
+
+def print_peephole(report):
+    """
+    Prints what `peephole` changed
+        - Accepts the report dict it returned
+        - Returns nothing
+            - instead prints out values
+    """
+    print(f"Folded:  {', '.join(f'P{addr}' for addr in report['folded']) or 'nothing'}")
+    print(f"Removed: {', '.join(f'P{addr}' for addr in report['removed']) or 'nothing'}")
+    for start, jump, before, after in report["loops"]:
+        print(f"Loop P{start}-P{jump}: {before} -> {after} cycles per trip ({before - after} saved)")
+
 def main():
     """Main event loop"""
     global _prg_mode
@@ -351,8 +2252,299 @@ def main():
         print_ui()
         
         user_input = get_user_input()   # get user input
-        if user_input and not process_opcode(*user_input):
-            increment_clk()
+        if user_input:
+            _cpu.execute(*user_input)
+
+# ========================== Live Frontend ==========================
+class LiveSession:
+    """
+    Runs the machine as an asyncio task while commands are read at the same time
+        - The machine runs in small batches and hands control back between them, so a command is never stuck behind a long run
+        - Commands:
+            - halt: stops the machine where it is
+            - resume: carries on from where it stopped
+            - step n: halts (if running) and runs exactly n cycles (1 if n is left out)
+                - a big n is run by the machine's task in batches like everything else, `halt` stops it part way
+            - speed hz: changes the clock rate, 0 runs as fast as possible
+            - back n: halts and goes back n cycles (1 if n is left out), goto c: halts and goes to cycle c (back or forward)
+            - show: prints the machine, reset: clears it (and halts), exit: quits
+        - Nothing ever throws the machine state away, halting and resuming can be done as many times as you like
+        - Going back needs a `Timeline`, made with the given checkpoint interval (0 turns it off and runs a bit faster)
+    """
+    def __init__(self, cpu, hz, checkpoint_interval=1024):
+        self.cpu = cpu
+        self.hz = hz
+        self.cycles = 0
+        self.checkpoint_interval = checkpoint_interval
+        self.timeline = Timeline(cpu, checkpoint_interval) if checkpoint_interval else None
+        self.running = False
+        self.steps = 0  # cycles left of a `step` that's too big to run in one go
+        self._wake = asyncio.Event()
+        self._start = time.perf_counter()   # when the current stretch of paced running started
+        self._base = 0                      # cycle count at that point
+
+    def resume(self):
+        """Starts the machine running again."""
+        self.running = True
+        self.steps = 0
+        self._start, self._base = time.perf_counter(), self.cycles
+        self._wake.set()
+
+    def halt(self):
+        """Stops the machine (and any step that's still going) after the batch it is on."""
+        self.running = False
+        self.steps = 0
+
+    def step(self, cycles):
+        """
+        Halts and runs exactly `cycles` cycles
+            - Up to one batch is run straight away, anything bigger is handed to `core`
+            - Returns True if the steps are already done
+        """
+        self.halt()
+        if cycles <= _check_interval:
+            self._run(cycles)
+            return True
+        self.steps = cycles
+        self._wake.set()
+        return False
+
+    def set_speed(self, hz):
+        """Changes the clock rate (None for as fast as possible) without a jump in the pacing."""
+        self.hz = hz
+        self._start, self._base = time.perf_counter(), self.cycles
+
+    def _run(self, cycles):
+        """Runs some cycles, a fault halts the machine instead of ending the session."""
+        try:
+            if self.timeline:
+                self.timeline.run(cycles)
+            else:
+                self.cycles += self.cpu.run(cycles)
+        except IndexError:
+            self.halt()
+            print(f"\nFaulted at P{self.cpu.clock}: R15 doesn't exist (halted)\n> ", end="", flush=True)
+        finally:
+            if self.timeline:
+                self.cycles = self.timeline.cycle
+
+    def goto(self, cycle):
+        """Halts and moves the machine to a cycle (see `Timeline.goto`), a fault on the way forward stops it there."""
+        self.halt()
+        try:
+            self.timeline.goto(cycle)
+        except IndexError:
+            print(f"Faulted at P{self.cpu.clock}: R15 doesn't exist")
+        self.cycles = self.timeline.cycle
+        self._start, self._base = time.perf_counter(), self.cycles
+
+    async def core(self):
+        """The task that runs the machine, forever (cancel it to stop)."""
+        while True:
+            if self.steps:
+                batch = min(self.steps, _check_interval)
+                self.steps -= batch
+                done = not self.steps
+                self._run(batch)
+                if done and not self.running:
+                    print("\n", end="")
+                    print_ui(self.cpu)
+                    print(f"{self.status()}\n> ", end="", flush=True)
+                await asyncio.sleep(0)
+                continue
+            if not self.running:
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+
+            if self.hz is None:
+                batch = _check_interval
+            else:
+                elapsed = time.perf_counter() - self._start
+                batch = min(int(elapsed * self.hz) - (self.cycles - self._base), _check_interval)
+                if batch <= 0:
+                    await asyncio.sleep((self.cycles - self._base + 1) / self.hz - elapsed)
+                    continue
+
+            self._run(batch)
+            await asyncio.sleep(0)  # let the command reader in
+
+    def status(self):
+        """Returns a one line summary of the machine."""
+        state = "running" if self.running else f"stepping ({self.steps:,} left)" if self.steps else "halted"
+        speed = "max speed" if self.hz is None else f"{self.hz:g}hz"
+        return f"{state} at P{self.cpu.clock}, {self.cycles:,} cycles ({speed})"
+
+    def handle(self, command):
+        """
+        Carries out one command
+            - Accepts the command line the user typed
+            - Returns False if the session should end, otherwise True
+        """
+        parts = command.split()
+        if not parts:
+            print(self.status())
+        elif parts[0] == "exit":
+            return False
+        elif parts[0] == "halt":
+            self.halt()
+            print_ui(self.cpu)
+            print(self.status())
+        elif parts[0] == "resume":
+            self.resume()
+            print(self.status())
+        elif parts[0] == "step" and len(parts) <= 2 and (len(parts) == 1 or parts[1].isdigit()):
+            if self.step(int(parts[1]) if len(parts) == 2 else 1):
+                print_ui(self.cpu)
+            print(self.status())
+        elif parts[0] in ("back", "goto") and not self.timeline:
+            print("Going back is turned off (--checkpoint-interval 0)")
+        elif parts[0] == "back" and len(parts) <= 2 and (len(parts) == 1 or parts[1].isdigit()):
+            self.goto(self.cycles - (int(parts[1]) if len(parts) == 2 else 1))
+            print_ui(self.cpu)
+            print(self.status())
+        elif parts[0] == "goto" and len(parts) == 2 and parts[1].isdigit():
+            self.goto(int(parts[1]))
+            print_ui(self.cpu)
+            print(self.status())
+        elif parts[0] == "speed" and len(parts) == 2:
+            try:
+                hz = clock_rate(parts[1])
+            except ValueError:
+                print("Usage: speed <hz> (0 for as fast as possible)")
+            else:
+                self.set_speed(hz or None)
+                print(self.status())
+        elif parts[0] == "show":
+            print_ui(self.cpu)
+            print(self.status())
+        elif parts[0] == "reset":
+            self.halt()
+            if self.timeline:
+                self.timeline.detach()
+            self.cpu.reset()
+            self.cycles = 0
+            self.timeline = Timeline(self.cpu, self.checkpoint_interval) if self.checkpoint_interval else None
+            print("System reset.")
+        else:
+            print("Commands: halt, resume, step [n], back [n], goto <cycle>, speed <hz>, show, reset, exit")
+        return True
+
+    async def commands(self):
+        """The task that reads commands, returns when the user exits (or stdin closes)."""
+        loop = asyncio.get_running_loop()
+        while True:
+            print("> ", end="", flush=True)
+            line = await loop.run_in_executor(None, sys.stdin.readline)
+            if not line or not self.handle(line.strip().lower()):
+                return
+
+async def live(cpu, hz, checkpoint_interval=1024):
+    """
+    Runs a live session on a machine until the user exits
+        - Accepts the machine, the starting clock rate (None for as fast as possible) and the checkpoint interval (0 for none)
+        - The machine starts running straight away
+        - Returns nothing
+    """
+    session = LiveSession(cpu, hz, checkpoint_interval)
+    print("Live mode. Commands: halt, resume, step [n], back [n], goto <cycle>, speed <hz>, show, reset, exit")
+    session.resume()
+    print(session.status())
+
+    core = asyncio.create_task(session.core())
+    try:
+        await session.commands()
+    finally:
+        core.cancel()
+
+def cli(argv=None):
+    """
+    Parses the command line and starts the simulator in the requested mode
+        - Accepts an optional list of arguments (defaults to sys.argv)
+        - With no arguments starts the interactive simulator like before
+        - Returns nothing
+    """
+    parser = argparse.ArgumentParser(description="Simple 4-bit LEG like CPU simulator")
+    parser.add_argument("program_file", nargs="?", help="text file with one program word per line (e.g. `011 0001 0101`)")
+    parser.add_argument("--headless", action="store_true", help="run the program without any ui as fast as possible")
+    parser.add_argument("--max-cycles", type=int, help="stop a headless run after this many cycles")
+    parser.add_argument("--deadline", type=float, help="stop a headless run after this many seconds")
+    parser.add_argument("--compile", action="store_true", help="compile the program into python before a headless run")
+    parser.add_argument("--detect-loops", action="store_true", help="stop a headless run as soon as the program halts or starts repeating itself")
+    parser.add_argument("--fast-forward", action="store_true", help="skip whole trips around a loop during a headless run with --max-cycles")
+    parser.add_argument("--hz", type=clock_rate, help="clock rate for `run` in the interactive simulator (0 runs as fast as possible, default 5)")
+    parser.add_argument("--fps", type=float, help="how many times a second `run` redraws the screen (default 30)")
+    parser.add_argument("--save-image", metavar="FILE", help="save the loaded program as a binary image and exit")
+    parser.add_argument("--optimize", action="store_true",
+                        help="fold constants and remove instructions nothing can see the result of, print what changed and carry on with the new program")
+    parser.add_argument("--observe", metavar="REGS", help="registers that count as output for --optimize, e.g. 1,2 (all of them by default)")
+    parser.add_argument("--disassemble", action="store_true", help="print the loaded program as assembly and exit")
+    parser.add_argument("--live", action="store_true", help="run the program straight away and take halt/step/resume/speed commands while it runs")
+    parser.add_argument("--profile", metavar="FILE", help="count what a headless run spends its cycles on, save the counts as json and print the busiest addresses")
+    parser.add_argument("--checkpoint-interval", type=int, default=1024, metavar="N",
+                        help="in --live mode save the whole machine every N cycles so `back` and `goto` are quick (0 turns it off)")
+    parser.add_argument("--trace", metavar="FILE", help="record every cycle of a headless run into a trace file (read it back with `read_trace`)")
+    args = parser.parse_args(argv)
+
+    global _run_speed, _frame_rate  # include global var
+    if args.hz is not None:
+        _run_speed = args.hz or None
+    if args.fps is not None:
+        if not math.isfinite(args.fps) or args.fps <= 0:
+            parser.error("--fps has to be a number of frames a second, more than 0")
+        _frame_rate = args.fps
+
+    if args.program_file:
+        _cpu.load_program(read_program_file(args.program_file))
+    if args.optimize:
+        try:
+            observed = range(15) if not args.observe else [int(r.strip().lstrip("rR")) for r in args.observe.split(",")]
+        except ValueError:
+            parser.error("--observe takes register numbers separated by commas, e.g. 1,2")
+        optimized, report = peephole(_cpu.program, observed)
+        print_peephole(report)
+        _cpu.load_program(optimized)
+    if args.save_image:
+        save_image(args.save_image, _cpu.program)
+        return
+    if args.disassemble:
+        print(disassemble(_cpu.program), end="")
+        return
+
+    if args.headless:
+        if args.max_cycles is None and args.deadline is None and not args.detect_loops:
+            parser.error("--headless needs --max-cycles, --deadline and/or --detect-loops")
+        if (args.profile or args.trace) and (args.compile or args.detect_loops or args.fast_forward):
+            parser.error("--profile and --trace only work with a plain (interpreted) headless run")
+
+        profiler = Profiler() if args.profile else None
+        if profiler is not None:
+            profiler.attach(_cpu)
+        tracer = Tracer(path=args.trace) if args.trace else None
+        if tracer is not None:   # a new tracer has a length of 0, so it has to be checked against None
+            tracer.attach(_cpu)
+        try:
+            result = run_headless(args.max_cycles, args.deadline, args.compile, args.detect_loops, args.fast_forward)
+            print_report(result)
+        finally:
+            if tracer is not None:
+                tracer.detach(_cpu)     # a run that faults still leaves the trace of how it got there
+        if tracer is not None:
+            # check the file's size so a trace that's missing cycles is never mistaken for a good one
+            recorded = (os.path.getsize(args.trace) - _image_header.size) // _trace_record_size
+            if recorded != result["cycles"]:
+                sys.exit(f"{args.trace}: has {recorded:,} cycles but {result['cycles']:,} were run")
+            print(f"Traced {recorded:,} cycles to {args.trace}")
+        if profiler is not None:
+            profiler.dump(args.profile)
+            print(profiler.hot_spots(_cpu.program))
+    elif args.live:
+        try:
+            asyncio.run(live(_cpu, _run_speed, args.checkpoint_interval))
+        except KeyboardInterrupt:
+            pass
+    else:
+        main()
 
 if __name__ == "__main__":
-    main()  # run that thang'
\ No newline at end of file
+    cli()   # run that thang'
\ No newline at end of file
@@ -0,0 +1,24 @@
+# -----------------------------------------------------
+# Loads `4-bit_cpu_sim.py` so the scripts in this folder can use it.
+# The file name starts with a number and has a dash in it, so it can't just be imported.
+# It is registered as `cpu_sim` so worker processes and pickled results can find it again.
+# -----------------------------------------------------
+
+import importlib.util, os, sys
+
+SIM_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "4-bit_cpu_sim.py")
+
+def load():
+    """
+    Loads the simulator module (only once per process)
+        - Accepts no inputs
+        - Returns the module, the same one every time
+    """
+    if "cpu_sim" not in sys.modules:
+        spec = importlib.util.spec_from_file_location("cpu_sim", SIM_PATH)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules["cpu_sim"] = module
+        spec.loader.exec_module(module)
+    return sys.modules["cpu_sim"]
+
+sim = load()
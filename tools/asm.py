@@ -0,0 +1,176 @@
+# -----------------------------------------------------
+# README!
+#
+# Assembles mnemonic programs (`.asm` files, see `assemble` in the simulator) into binary images, and turns
+# images and program files back into assembly.
+#
+# BUILD:
+# every `.asm` file given (directories are searched for them) is assembled into an image next to it, or under --out
+# with the same folder layout, or all into one corpus file with --corpus.
+# Assembled words are cached by a hash of the source (in --cache, `.asm_cache` by default) so a source that hasn't
+# changed is never assembled again, even if it was renamed or copied.
+#
+# DISASM:
+# prints every program in the given files (images, corpus files, `.asm` or text program files) as assembly,
+# or writes one `.asm` per program into --out.
+#
+# Example:
+# python3 tools/asm.py build programs/ --out build/
+# python3 tools/asm.py build programs/ --corpus programs.bin
+# python3 tools/asm.py disasm build/count.bin
+# -----------------------------------------------------
+
+import argparse, hashlib, os, sys
+
+from _sim import sim
+
+CACHE_VERSION = 1   # bump this whenever `assemble` changes what it makes, so old cache entries are never used
+
+# ========================== Build Cache ==========================
+class BuildCache:
+    """
+    Assembled programs stored by the hash of their source
+        - `words(source, name)` returns the words for a source, only assembling it if it's never been seen before
+        - Entries are single program images at `<dir>/<first 2 hex digits>/<hash>.bin`
+        - `hits` and `misses` count what happened since it was made
+    """
+    def __init__(self, path):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, source):
+        """Returns the hash a source is stored under."""
+        return hashlib.sha256(f"{CACHE_VERSION}\n".encode() + source.encode()).hexdigest()
+
+    def words(self, source, name):
+        """
+        Gets the assembled words for a source
+            - Accepts the source text and a name for error messages
+            - Raises ValueError if the source doesn't assemble (nothing is cached for it)
+            - Returns a tuple of 16 words
+        """
+        key = self.key(source)
+        entry = os.path.join(self.path, key[:2], key + ".bin")
+        try:
+            words = sim.load_image(entry)
+            self.hits += 1
+            return words
+        except (OSError, ValueError):
+            pass    # not cached yet (or the entry is broken), assemble it again
+
+        words = tuple(sim.assemble(source, name))
+        words += (0,)*(16 - len(words))
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        partial = f"{entry}.{os.getpid()}"
+        sim.save_image(partial, words)
+        os.replace(partial, entry)     # so a build that gets killed never leaves half an entry behind
+        self.misses += 1
+        return words
+
+# ========================== Build ==========================
+def find_sources(paths):
+    """
+    Finds every source file to build
+        - Accepts a list of files and directories (directories are searched all the way down for `.asm` files)
+        - Returns a sorted list of (path, path relative to the directory it was found in) pairs
+    """
+    sources = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                sources += [(os.path.join(root, f), os.path.relpath(os.path.join(root, f), path))
+                            for f in files if f.endswith(".asm")]
+        else:
+            sources.append((path, os.path.basename(path)))
+    return sorted(sources)
+
+def build(paths, cache, out=None, corpus=None):
+    """
+    Assembles every source into images
+        - Accepts the files and directories to build, a BuildCache, the directory to put images in (next to
+          the sources if None) and a corpus file to write everything into instead
+        - Raises ValueError at the first source that doesn't assemble
+        - Returns the number of programs built
+    """
+    sources = find_sources(paths)
+
+    def programs():
+        for path, relative in sources:
+            with open(path) as f:
+                yield cache.words(f.read(), path)
+
+    if corpus:
+        return sim.write_corpus(corpus, programs())
+
+    for (path, relative), words in zip(sources, programs()):
+        target = os.path.splitext(os.path.join(out, relative) if out else path)[0] + ".bin"
+        os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+        sim.save_image(target, words)
+    return len(sources)
+
+# ========================== Disassemble ==========================
+def read_programs(path):
+    """Yields (name, words) for every program in a file: every record of a corpus, or the one program in anything else."""
+    with open(path, "rb") as f:
+        is_image = f.read(len(sim._image_magic)) == sim._image_magic
+    if not is_image:
+        yield os.path.basename(path), sim.read_program_file(path)
+        return
+    with sim.Corpus(path) as corpus:
+        name = os.path.splitext(os.path.basename(path))[0]
+        for i, words in enumerate(corpus.programs()):
+            yield (f"{name}_{i}" if len(corpus) > 1 else name), words
+
+def disasm(paths, out=None):
+    """
+    Disassembles every program in the given files
+        - Accepts a list of files and a directory to write `.asm` files into (printed if None)
+        - Returns the number of programs disassembled
+    """
+    count = 0
+    for path in paths:
+        for name, words in read_programs(path):
+            text = sim.disassemble(words)
+            if out:
+                os.makedirs(out, exist_ok=True)
+                with open(os.path.join(out, name + ".asm"), "w") as f:
+                    f.write(text)
+            else:
+                print(f"# {name}\n{text}")
+            count += 1
+    return count
+
+def cli(argv=None):
+    """
+    Parses the command line and builds or disassembles
+        - Accepts an optional list of arguments (defaults to sys.argv)
+        - Returns nothing
+            - exits with an error if a source doesn't assemble
+    """
+    parser = argparse.ArgumentParser(description="Assemble and disassemble 4-bit CPU programs")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="assemble .asm files into binary images")
+    build_parser.add_argument("paths", nargs="+", help=".asm files or directories")
+    build_parser.add_argument("--out", help="directory for the images (next to the sources by default)")
+    build_parser.add_argument("--corpus", metavar="FILE", help="write every program into one corpus file instead")
+    build_parser.add_argument("--cache", default=".asm_cache", help="directory for the build cache")
+    disasm_parser = commands.add_parser("disasm", help="print images or program files as assembly")
+    disasm_parser.add_argument("paths", nargs="+", help="images, corpus files or program files")
+    disasm_parser.add_argument("--out", help="directory to write .asm files into (printed by default)")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "build":
+            cache = BuildCache(args.cache)
+            count = build(args.paths, cache, args.out, args.corpus)
+            print(f"Built {count} programs ({cache.misses} assembled, {cache.hits} from the cache)")
+        else:
+            count = disasm(args.paths, args.out)
+            if args.out:
+                print(f"Disassembled {count} programs")
+    except ValueError as e:
+        sys.exit(str(e))
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,154 @@
+# -----------------------------------------------------
+# README!
+#
+# Microbenchmarks for the hot paths of the python simulator, with a stored baseline to catch slow downs.
+#
+# Every benchmark is timed as nanoseconds per call (or per cycle for the full runs), best of --repeat runs.
+# Results are printed as a table and can be written as json with --out.
+#
+# BASELINE:
+# --save-baseline stores the results (and the threshold) in --baseline (tools/bench_baseline.json by default)
+# every run after that compares against it and exits with 1 if anything got slower by more than the threshold
+#   - the threshold is a fraction, 0.25 means 25% slower fails, set it with --threshold or in the baseline file
+#   - baselines are only meaningful on the machine they were made on
+#
+# Example:
+# python3 tools/bench.py --save-baseline
+# python3 tools/bench.py --only run/
+# -----------------------------------------------------
+
+import argparse, contextlib, io, json, os, sys, timeit
+
+from _sim import sim
+from bench_c import CORPUS
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+RUN_CYCLES = 100000  # cycles per call for the full run benchmarks
+
+# ========================== Benchmarks ==========================
+def benchmarks():
+    """
+    Builds every benchmark
+        - Accepts no inputs
+        - Returns a dict of name -> (function to time, how many operations one call is)
+    """
+    regs = bytearray(range(15))
+    cpu = sim.CPU(registers=range(15))
+    out = {
+        "helpers/int_to_bits": (lambda: sim.int_to_bits(11), 1),
+        "helpers/bits_to_int": (lambda: sim.bits_to_int([1, 0, 1, 1]), 1),
+        "helpers/encode_word": (lambda: sim.encode_word(3, 1, 5), 1),
+        "helpers/decode_word": (lambda: sim.decode_word(0b01100010101), 1),
+        "alu/add": (lambda: sim.add(regs, 1, 2), 1),
+        "alu/sub": (lambda: sim.sub(regs, 1, 2), 1),
+        "alu/move": (lambda: sim.move(regs, 1, 2), 1),
+        "alu/immediate": (lambda: sim.immediate(regs, 1, 5), 1),
+        "alu/jump_if_zero": (lambda: sim.jump_if_zero(regs, 5, 1), 1),
+        "alu/logical_and": (lambda: sim.logical_and(regs, 1, 2), 1),
+        "alu/logical_or": (lambda: sim.logical_or(regs, 1, 2), 1),
+        "alu/logical_not": (lambda: sim.logical_not(regs, 1, 2), 1),
+        "cpu/process_opcode": (lambda: sim.process_opcode(regs, 0, 1, 2), 1),
+        "cpu/increment_clk": (cpu.increment_clk, 1),
+        "cpu/step": (cpu.step, 1),
+        "ui/print_ui": (print_ui_quietly, 1),
+    }
+
+    for name in ("count", "jz_heavy", "logic_chain"):
+        words = [sim.encode_word(*(int(part, 2) for part in line.split())) for line in CORPUS[name]]
+        out[f"run/{name}"] = (run_bench(words, False), RUN_CYCLES)
+        out[f"run/{name}/compiled"] = (run_bench(words, True), RUN_CYCLES)
+
+    # the same program on wider machines, these should cost the same per cycle as the 4-bit one
+    for config in (sim.MachineConfig(8, 15, 256), sim.MachineConfig(32, 15, 16)):
+        words = [config.encode(*sim.decode_word(sim.encode_word(*(int(part, 2) for part in line.split()))))
+                 for line in CORPUS["count"]]
+        name = f"run/count/{config.data_bits}b{config.words}w"
+        out[name] = (run_bench(words, False, config), RUN_CYCLES)
+        out[f"{name}/compiled"] = (run_bench(words, True, config), RUN_CYCLES)
+    return out
+
+def run_bench(words, compiled, config=None):
+    """Returns a function that runs a fresh machine with the given program for `RUN_CYCLES` cycles."""
+    def bench():
+        sim.CPU(words, config=config).run(RUN_CYCLES, compiled=compiled)
+    return bench
+
+def print_ui_quietly():
+    """Renders the ui into a throw away buffer so only the formatting is timed."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        sim.print_ui()
+
+def measure(fn, ops, repeat):
+    """
+    Times one benchmark
+        - Accepts the function, how many operations one call is and how many times to repeat the measurement
+        - Returns the best time in nanoseconds per operation
+    """
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number / ops * 1e9
+
+# ========================== Baseline ==========================
+def compare(results, baseline, threshold):
+    """
+    Compares results with a baseline
+        - Accepts the results dict, the baseline's metrics dict and the allowed slow down as a fraction
+        - Metrics missing from either side are skipped
+        - Returns a dict of name -> change as a fraction (positive is slower), and a list of names that went past the threshold
+    """
+    changes = {}
+    regressions = []
+    for name, ns in results.items():
+        if name in baseline:
+            changes[name] = ns / baseline[name] - 1
+            if changes[name] > threshold:
+                regressions.append(name)
+    return changes, regressions
+
+def cli(argv=None):
+    """
+    Parses the command line, runs the benchmarks and checks them against the baseline
+        - Accepts an optional list of arguments (defaults to sys.argv)
+        - Returns the exit code (1 if anything regressed past the threshold)
+    """
+    parser = argparse.ArgumentParser(description="Microbenchmarks for the 4-bit CPU simulator")
+    parser.add_argument("--only", help="only run benchmarks whose name starts with this")
+    parser.add_argument("--repeat", type=int, default=5, help="measurements per benchmark (the best one is used)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline file to compare against / save to")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--threshold", type=float, help="allowed slow down as a fraction (default 0.25, or whatever the baseline says)")
+    parser.add_argument("--out", help="write the results as json to this file")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name, (fn, ops) in benchmarks().items():
+        if args.only and not name.startswith(args.only):
+            continue
+        results[name] = measure(fn, ops, args.repeat)
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    threshold = args.threshold if args.threshold is not None else baseline.get("threshold", 0.25)
+    changes, regressions = compare(results, baseline.get("metrics", {}), threshold)
+
+    print(f"{'benchmark':<28}{'ns/op':>12}{'change':>10}")
+    for name, ns in results.items():
+        change = f"{changes[name]:+.1%}" if name in changes else ""
+        flag = "  REGRESSED" if name in regressions else ""
+        print(f"{name:<28}{ns:>12.1f}{change:>10}{flag}")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"metrics": results, "changes": changes, "regressions": regressions, "threshold": threshold}, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump({"threshold": threshold, "metrics": results}, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+    elif regressions:
+        print(f"\n{len(regressions)} benchmark(s) got more than {threshold:.0%} slower than the baseline")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(cli())
@@ -0,0 +1,184 @@
+# -----------------------------------------------------
+# README!
+#
+# Runs the same programs through the python and the C simulator, times both and checks they end up in the same state.
+#
+# The C version is compiled first (with `cc -O2`, change it with --cc) unless --binary points at one that's already built.
+# Both versions run every program for --cycles cycles from all zero registers and a zero clock.
+# Python is timed with the normal interpreter and with `--compile`, C is timed inside the binary (so process start up isn't counted).
+#
+# The exit code is 1 if any program ended up in a different state, so this can be used as a check as well as a benchmark.
+#
+# Example:
+# python3 tools/bench_c.py --cycles 5000000
+# -----------------------------------------------------
+
+import argparse, os, random, subprocess, sys, tempfile, time
+
+from _sim import sim
+
+# ========================== Corpus ==========================
+# every program is written the same way as a program file, none of them touch R15 (the two versions handle that differently)
+CORPUS = {
+    "count": [
+        "011 0010 0001",    # IMMD R2 1
+        "000 0001 0010",    # ADD R1 R2 -> R0
+        "010 0000 0001",    # MOV R0 R1
+        "100 0001 0011",    # JZ R3 -> 1 (R3 is always zero)
+    ],
+    "countdown_halt": [
+        "011 0001 0011",    # IMMD R1 3
+        "011 0010 0001",    # IMMD R2 1
+        "001 0001 0010",    # SUB R1 R2 -> R0
+        "010 0000 0001",    # MOV R0 R1
+        "100 0110 0001",    # JZ R1 -> 6
+        "100 0010 0011",    # JZ R3 -> 2
+        "100 0110 0011",    # JZ R3 -> 6 (halt)
+    ],
+    "jz_heavy": [
+        "011 0001 0001",    # IMMD R1 1
+        "011 0010 0001",    # IMMD R2 1
+        "100 0100 0011",    # JZ R3 -> 4 (always taken)
+        "011 0011 0001",    # IMMD R3 1 (never runs)
+        "001 0001 0010",    # SUB R1 R2 -> R0
+        "010 0000 0001",    # MOV R0 R1
+        "100 1000 0001",    # JZ R1 -> 8 (taken every 16th time)
+        "100 0010 0011",    # JZ R3 -> 2
+        "011 0001 1111",    # IMMD R1 15
+        "100 0010 0011",    # JZ R3 -> 2
+    ],
+    "logic_chain": [
+        "011 0001 1010",    # IMMD R1 10
+        "011 0010 0110",    # IMMD R2 6
+        "101 0001 0010",    # AND R1 R2 -> R0
+        "110 0000 0001",    # OR R0 R1 -> R0
+        "111 0000 0011",    # NOT R0 -> R3
+        "111 0011 0001",    # NOT R3 -> R1
+        "000 0001 0010",    # ADD R1 R2 -> R0
+        "010 0000 0010",    # MOV R0 R2
+        "100 0010 0100",    # JZ R4 -> 2
+    ],
+    "fibonacci": [
+        "011 0001 0001",    # IMMD R1 1
+        "011 0010 0001",    # IMMD R2 1
+        "000 0001 0010",    # ADD R1 R2 -> R0
+        "010 0010 0001",    # MOV R2 R1
+        "010 0000 0010",    # MOV R0 R2
+        "100 0010 0011",    # JZ R3 -> 2
+    ],
+}
+
+def random_corpus(count, seed):
+    """
+    Makes some random programs to go with the hand written ones
+        - Accepts how many to make and a seed
+        - None of them touch R15
+        - Returns a dict of name -> list of program lines
+    """
+    rng = random.Random(seed)
+    programs = {}
+    for n in range(count):
+        lines = []
+        for _ in range(16):
+            op = rng.randrange(8)
+            v1 = rng.randrange(16) if op == 4 else rng.randrange(15)    # jump targets can be any address
+            v2 = rng.randrange(16) if op == 3 else rng.randrange(15)    # immediate values can be anything
+            lines.append(f"{op:03b} {v1:04b} {v2:04b}")
+        programs[f"random_{n}"] = lines
+    return programs
+
+# ========================== Runners ==========================
+def run_python(lines, cycles, compiled):
+    """
+    Runs one program through the python simulator
+        - Accepts the program lines, the number of cycles and whether to use the compiled mode
+        - Returns (registers, clock, elapsed seconds)
+    """
+    words = [sim.encode_word(*(int(part, 2) for part in line.split())) for line in lines]
+    cpu = sim.CPU(words)
+    if compiled:
+        sim.compile_program(cpu.program)    # compile ahead of time so only the run is timed, like the C side
+    start = time.perf_counter()
+    cpu.run(cycles, compiled=compiled)
+    return list(cpu.registers), cpu.clock, time.perf_counter() - start
+
+def run_c(binary, lines, cycles):
+    """
+    Runs one program through the C simulator's headless mode
+        - Accepts the path to the binary, the program lines and the number of cycles
+        - Returns (registers, clock, elapsed seconds) as reported by the binary
+    """
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as f:
+        f.write("\n".join(lines) + "\n")
+    try:
+        out = subprocess.run([binary, "--headless", f.name, str(cycles)], capture_output=True, text=True, check=True).stdout
+    finally:
+        os.unlink(f.name)
+
+    fields = dict(line.split(":", 1) for line in out.splitlines() if ":" in line)
+    return [int(v) for v in fields["registers"].split()], int(fields["clock"]), float(fields["elapsed"])
+
+def build_c(cc, out_dir):
+    """Compiles `4-bit_cpu_sim.c` with optimisations on and returns the path to the binary."""
+    source = os.path.join(os.path.dirname(sim.__file__), "4-bit_cpu_sim.c")
+    binary = os.path.join(out_dir, "cpu_simulation")
+    subprocess.run([cc, "-O2", "-o", binary, source], check=True)
+    return binary
+
+# ========================== Benchmark ==========================
+def bench(binary, corpus, cycles):
+    """
+    Runs every program through all three runners and compares them
+        - Accepts the C binary, the corpus dict and the number of cycles
+        - Returns a list of result dicts (name, cycles/sec for each runner, and whether they all agree)
+    """
+    results = []
+    for name, lines in corpus.items():
+        py = run_python(lines, cycles, False)
+        pyc = run_python(lines, cycles, True)
+        c = run_c(binary, lines, cycles)
+        results.append({
+            "name": name,
+            "python": cycles / py[2],
+            "python_compiled": cycles / pyc[2],
+            "c": cycles / c[2] if c[2] > 0 else float("inf"),
+            "agree": py[:2] == pyc[:2] == c[:2],
+            "states": {"python": py[:2], "python_compiled": pyc[:2], "c": c[:2]},
+        })
+    return results
+
+def print_results(results):
+    """Prints the benchmark table and any programs where the versions disagree."""
+    print(f"{'program':<16}{'python':>14}{'compiled':>14}{'c':>16}  state")
+    for r in results:
+        print(f"{r['name']:<16}{r['python']:>14,.0f}{r['python_compiled']:>14,.0f}{r['c']:>16,.0f}  {'ok' if r['agree'] else 'DIFFERENT'}")
+    for r in results:
+        if not r["agree"]:
+            print(f"\n{r['name']} ended up in different states:")
+            for runner, (regs, clock) in r["states"].items():
+                print(f"  {runner:<16} registers {regs} clock {clock}")
+
+def cli(argv=None):
+    """
+    Parses the command line, builds the C version if needed and runs the benchmark
+        - Accepts an optional list of arguments (defaults to sys.argv)
+        - Returns the exit code (1 if any program ended up in different states)
+    """
+    parser = argparse.ArgumentParser(description="Compare the python and C simulators for speed and results")
+    parser.add_argument("--cycles", type=int, default=1000000, help="cycles to run every program for")
+    parser.add_argument("--random", type=int, default=8, help="random programs to add to the corpus")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the random programs")
+    parser.add_argument("--binary", help="an already built C simulator to use instead of compiling one")
+    parser.add_argument("--cc", default="cc", help="C compiler to build the C version with")
+    args = parser.parse_args(argv)
+
+    corpus = dict(CORPUS, **random_corpus(args.random, args.seed))
+    with tempfile.TemporaryDirectory() as tmp:
+        binary = args.binary or build_c(args.cc, tmp)
+        results = bench(binary, corpus, args.cycles)
+
+    print_results(results)
+    return 0 if all(r["agree"] for r in results) else 1
+
+if __name__ == "__main__":
+    sys.exit(cli())
@@ -0,0 +1,330 @@
+# -----------------------------------------------------
+# README!
+#
+# A long running job server, so short runs don't pay for starting python and loading the simulator every time.
+#
+# JOBS:
+# clients connect to a Unix socket (--socket, the default) or a localhost port (--port) and send one json object per line:
+#   {"id": 1, "program": [words], "registers": [15 values], "clock": 0, "max_cycles": 1000}
+#   - "image" (one base64 program record, see `pack_image` in the simulator) can be sent instead of "program"
+#   - "registers", "clock" and "id" are optional, "max_cycles" isn't
+# every job gets one json line back as soon as it's done (so not always in the order they were sent), with the same "id":
+#   {"id": 1, "registers": [...], "clock": 3, "verdict": "loop", "pc": 3, "start": 2, "period": 4, "cycles": 1000}
+#   or {"id": 1, "error": "..."} if the job didn't make sense (the id is null if it couldn't be read)
+# runs go through `CPU.fast_forward`, so the answer is exact however big the budget is (see sweep.py)
+#
+# WORKERS:
+# the worker processes are started (and have loaded the simulator) before the first client connects, and each one
+# keeps a single machine that it loads every job into instead of making a new one.
+# Jobs are handed out in batches of up to --batch, a batch is sent as soon as it's full or --linger milliseconds after
+# its first job came in, and no more than two batches per worker are ever out at once.
+#
+# BACK-PRESSURE:
+# at most --queue jobs wait for a worker. When that's full the server stops reading from clients until there's room,
+# so a client sending faster than the workers can keep up just finds its writes blocking.
+#
+# Example:
+# python3 tools/serve.py serve --socket /tmp/cpu.sock
+# python3 tools/serve.py submit count.asm loop.bin --socket /tmp/cpu.sock --max-cycles 100000
+# -----------------------------------------------------
+
+import argparse, asyncio, base64, json, os, sys, time
+from concurrent.futures import ProcessPoolExecutor
+
+from _sim import sim
+
+DEFAULT_SOCKET = "/tmp/4-bit-cpu.sock"
+
+_cpu = None     # the machine this worker process loads every job into
+
+# ========================== Workers ==========================
+def warm_up():
+    """
+    Gets a worker process ready before it's given any jobs (the pool's initializer)
+        - The simulator is already loaded by importing this file, this makes the machine and runs it once
+        - Returns nothing
+    """
+    global _cpu
+    _cpu = sim.CPU()
+    _cpu.fast_forward(16)
+
+def run_jobs(jobs):
+    """
+    Runs one batch of jobs in a worker process
+        - Accepts a list of (program words, registers, clock, cycle budget)
+        - Every job is loaded into the same machine, one after the other
+        - Returns a list of result dicts in the same order
+    """
+    results = []
+    for program, registers, clock, max_cycles in jobs:
+        _cpu.load_program(program)
+        _cpu.registers[:] = bytes(registers)
+        _cpu.clock = clock
+        result = _cpu.fast_forward(max_cycles)
+        result.update(registers=list(_cpu.registers), clock=_cpu.clock)
+        results.append(result)
+    return results
+
+# ========================== Jobs ==========================
+def parse_job(request):
+    """
+    Reads one job sent by a client
+        - Accepts the decoded json object
+        - Raises ValueError if anything about it is wrong, with what it was
+        - Returns (program words, registers, clock, cycle budget)
+    """
+    try:
+        if "image" in request:
+            record = base64.b64decode(request["image"])
+            if len(record) != sim._image_record_size:
+                raise ValueError(f"an image is {sim._image_record_size} bytes, not {len(record)}")
+            program = sim.unpack_image(record)
+        else:
+            program = tuple(int(word) for word in request["program"])
+        registers = [int(value) for value in request.get("registers", [0]*15)]
+        clock = int(request.get("clock", 0))
+        max_cycles = int(request["max_cycles"])
+    except KeyError as e:
+        raise ValueError(f"no {e.args[0]!r}") from None
+    except (TypeError, ValueError) as e:
+        raise ValueError(str(e)) from None
+
+    if len(program) > 16 or any(not 0 <= word < 2048 for word in program):
+        raise ValueError("a program is up to 16 11-bit words")
+    if len(registers) != 15 or any(not 0 <= value < 16 for value in registers):
+        raise ValueError("registers have to be 15 values from 0 to 15")
+    if not 0 <= clock < 16 or max_cycles < 0:
+        raise ValueError("the clock is 0 to 15 and the cycle budget can't be negative")
+    return program, registers, clock, max_cycles
+
+# ========================== Server ==========================
+class JobServer:
+    """
+    Takes jobs from any number of clients and runs them on a pool of worker processes
+        - `start()` starts the workers and begins listening, `close()` stops both
+        - `jobs` and `batches` count what's been run since it started
+    """
+    def __init__(self, workers=None, batch=64, linger=2.0, queue=4096):
+        self.workers = workers or os.cpu_count() or 1
+        self.batch = batch
+        self.linger = linger / 1000
+        self.queue = asyncio.Queue(queue)   # (connection, job id, job), full means clients have to wait
+        self.in_flight = asyncio.Semaphore(self.workers * 2)
+        self.pool = None
+        self.server = None
+        self.dispatcher = None
+        self.jobs = 0
+        self.batches = 0
+
+    async def start(self, socket_path=None, port=None):
+        """
+        Starts the worker pool and listens for clients
+            - Accepts a Unix socket path, or a port on localhost
+            - Returns nothing
+        """
+        self.pool = ProcessPoolExecutor(self.workers, initializer=warm_up)
+        # make every worker start up now instead of when the first batch comes in
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self.pool, run_jobs, []) for _ in range(self.workers)))
+
+        if port is not None:
+            self.server = await asyncio.start_server(self.handle_client, "127.0.0.1", port)
+        else:
+            if os.path.exists(socket_path):
+                os.remove(socket_path)  # left behind by a server that didn't shut down cleanly
+            self.server = await asyncio.start_unix_server(self.handle_client, socket_path)
+        self.dispatcher = asyncio.create_task(self.dispatch())
+
+    async def close(self):
+        """Stops listening and shuts the workers down (jobs already handed out are finished first)."""
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+        if self.dispatcher:
+            self.dispatcher.cancel()
+        if self.pool:
+            self.pool.shutdown()
+
+    async def handle_client(self, reader, writer):
+        """
+        Reads jobs from one client until it disconnects
+            - Jobs that don't make sense are answered right away, everything else goes in the queue
+            - Waiting for room in the queue is the back-pressure, nothing more is read from this client meanwhile
+            - Returns nothing
+        """
+        connection = {"writer": writer, "pending": 0, "done": asyncio.Event()}
+        connection["done"].set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line)
+                except json.JSONDecodeError as e:
+                    await self.reply(connection, {"id": None, "error": f"not json: {e}"})
+                    continue
+                job_id = request.get("id") if isinstance(request, dict) else None
+                try:
+                    if not isinstance(request, dict):
+                        raise ValueError("a job has to be a json object")
+                    job = parse_job(request)
+                except ValueError as e:
+                    await self.reply(connection, {"id": job_id, "error": str(e)})
+                    continue
+                connection["pending"] += 1
+                connection["done"].clear()
+                await self.queue.put((connection, job_id, job))
+            await connection["done"].wait()     # the client may have only closed its side, so send everything first
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self):
+        """
+        Takes jobs out of the queue in batches and hands them to the workers, forever
+            - A batch goes as soon as it has `batch` jobs, or `linger` seconds after its first one
+            - Only two batches per worker are out at once, so jobs back up in the queue (and then the clients)
+              instead of inside the pool
+            - Returns nothing
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.in_flight.acquire()
+            batch = [await self.queue.get()]
+            stop_at = loop.time() + self.linger
+            while len(batch) < self.batch:
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), max(stop_at - loop.time(), 0)))
+                except asyncio.TimeoutError:
+                    break
+            future = loop.run_in_executor(self.pool, run_jobs, [job for _, _, job in batch])
+            asyncio.create_task(self.finish(batch, future))
+
+    async def finish(self, batch, future):
+        """Sends a batch's results back to whoever sent each job once its worker is done with it."""
+        try:
+            results = await future
+        except Exception as e:  # a worker died, every job in the batch gets the error
+            results = [{"error": f"worker failed: {e!r}"}] * len(batch)
+        finally:
+            self.in_flight.release()
+        self.jobs += len(batch)
+        self.batches += 1
+        for (connection, job_id, _), result in zip(batch, results):
+            await self.reply(connection, dict(result, id=job_id))
+            connection["pending"] -= 1
+            if connection["pending"] == 0:
+                connection["done"].set()
+
+    async def reply(self, connection, message):
+        """Writes one result line to a client, quietly dropping it if the client has gone."""
+        writer = connection["writer"]
+        if writer.is_closing():
+            return
+        writer.write(json.dumps(message).encode() + b"\n")
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+async def serve(socket_path=None, port=None, workers=None, batch=64, linger=2.0, queue=4096):
+    """
+    Runs a job server until it's interrupted
+        - Accepts where to listen (a Unix socket path, or a localhost port) and the JobServer settings
+        - Returns nothing
+    """
+    server = JobServer(workers, batch, linger, queue)
+    await server.start(socket_path, port)
+    print(f"Serving on {f'127.0.0.1:{port}' if port is not None else socket_path} with {server.workers} workers")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
+        if port is None and os.path.exists(socket_path):
+            os.remove(socket_path)
+        print(f"Ran {server.jobs:,} jobs in {server.batches:,} batches")
+
+# ========================== Client ==========================
+async def submit(jobs, socket_path=None, port=None):
+    """
+    Sends jobs to a running server and collects the results
+        - Accepts a list of job dicts (see the README at the top) and where the server is
+        - Sending and reading happen at the same time, so any number of jobs can be sent without filling up both sides
+        - Returns the results in the order they came back
+    """
+    if port is not None:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    else:
+        reader, writer = await asyncio.open_unix_connection(socket_path)
+
+    async def send():
+        for job in jobs:
+            writer.write(json.dumps(job).encode() + b"\n")
+            await writer.drain()
+        writer.write_eof()
+
+    sender = asyncio.create_task(send())
+    results = []
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        results.append(json.loads(line))
+    await sender
+    writer.close()
+    return results
+
+def cli(argv=None):
+    """
+    Parses the command line and runs the server, or sends it program files
+        - Accepts an optional list of arguments (defaults to sys.argv)
+        - Returns nothing
+            - `submit` prints one result line per program
+    """
+    parser = argparse.ArgumentParser(description="Job server for the 4-bit CPU simulator")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_parser = commands.add_parser("serve", help="run the server until Ctrl+C")
+    submit_parser = commands.add_parser("submit", help="run program files on a running server")
+    submit_parser.add_argument("paths", nargs="+", help="program files (text, .asm or binary images)")
+    submit_parser.add_argument("--max-cycles", type=int, default=10000, help="cycle budget for every program")
+    submit_parser.add_argument("--registers", help="starting registers, 15 comma separated values (all zeros by default)")
+    for sub in (serve_parser, submit_parser):
+        sub.add_argument("--socket", default=DEFAULT_SOCKET, help=f"Unix socket to use (default {DEFAULT_SOCKET})")
+        sub.add_argument("--port", type=int, help="use this port on localhost instead of a Unix socket")
+    serve_parser.add_argument("--workers", type=int, help="worker processes (defaults to one per core)")
+    serve_parser.add_argument("--batch", type=int, default=64, help="most jobs handed to a worker at once")
+    serve_parser.add_argument("--linger", type=float, default=2.0, help="milliseconds to wait for a batch to fill up")
+    serve_parser.add_argument("--queue", type=int, default=4096, help="most jobs waiting for a worker before clients are held back")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        try:
+            asyncio.run(serve(args.socket, args.port, args.workers, args.batch, args.linger, args.queue))
+        except KeyboardInterrupt:
+            pass
+        return
+
+    registers = [int(value) for value in args.registers.split(",")] if args.registers else [0]*15
+    jobs = []
+    for i, path in enumerate(args.paths):
+        try:
+            program = sim.read_program_file(path)
+        except (OSError, ValueError) as e:
+            sys.exit(f"{path}: {e}")
+        jobs.append({"id": i, "program": list(program), "registers": registers, "max_cycles": args.max_cycles})
+
+    start = time.perf_counter()
+    try:
+        results = asyncio.run(submit(jobs, args.socket, args.port))
+    except OSError as e:
+        sys.exit(f"can't reach the server: {e}")
+    for result in sorted(results, key=lambda r: r["id"]):
+        print(json.dumps(dict(result, id=args.paths[result["id"]])))
+    print(f"{len(results)} results in {time.perf_counter() - start:.3f}s", file=sys.stderr)
+
+if __name__ == "__main__":
+    cli()
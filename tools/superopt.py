@@ -0,0 +1,266 @@
+# -----------------------------------------------------
+# README!
+#
+# Searches for the shortest instruction sequence that does exactly the same thing as part of a program.
+#
+# HOW:
+# The program is split into blocks: runs of instructions with no jumps in them and no jumps into the middle of them.
+# For every block, all sequences of 1, 2, 3... instructions (up to one shorter than the block) are tried,
+# built only out of the registers the block already uses. Each one is first run on a set of random register files
+# using the simulator's own ALU functions (on numpy arrays, so every sample runs at once), and anything that
+# matches is then checked register by register: every possible value of the registers that register's result
+# depends on (in either sequence) is tried. The first length that has a match is the shortest there is.
+# A match where some register depends on more than 5 others can't be checked like that in a reasonable time,
+# so it's only sampled, reported and left out of the program.
+# The first instruction of each length is spread over worker processes, and the rest are called off once one finds something.
+#
+# OUTPUT:
+# There is no unconditional jump and the clock wraps around, so the freed words can't just be cut out without
+# changing where everything else is. Instead each shorter block is moved to the end of its old space and the
+# words in front of it become jumps to the next address (which never do anything). Every jump into the block
+# is pointed past them, so only falling into the block from above still goes through them (`shrink_stretches`
+# in the simulator, which the peephole optimizer uses too).
+# --out saves the new program as an image.
+#
+# needs numpy (pip install numpy)
+#
+# Example:
+# python3 tools/superopt.py program.asm --max-length 3 --out program.bin
+# -----------------------------------------------------
+
+import argparse, multiprocessing, sys, time
+from multiprocessing import Pool
+
+from _sim import sim
+
+np = sim.np
+SAMPLES = 64            # random register files every candidate is tried on before a full check
+EXHAUSTIVE_LIMIT = 16**5    # full checks with more combinations than this use this many random ones instead
+
+_stop = None    # shared by every process from `make_pool`, set once the current search has found something
+
+# ========================== Semantics ==========================
+def apply(words, state):
+    """
+    Runs straight-line code on many register files at once
+        - Accepts jump-free words and a (15, N) uint8 array, one column per register file
+        - Every ALU function works on a numpy row the same way it does on one register, so they're called as they are
+        - Returns a new array, the one passed in isn't touched
+    """
+    state = state.copy()
+    for word in words:
+        op, v1, v2 = sim.decode_word(word)
+        sim._ops[op](state, v1, v2)
+    return state
+
+def reads(word):
+    """Returns the registers a word reads."""
+    return sim.register_reads(*sim.decode_word(word))
+
+def writes(word):
+    """Returns the register a (jump-free) word writes."""
+    return sim.register_dest(*sim.decode_word(word))
+
+def depends(words):
+    """Returns a dict of register -> the registers its value at the end of a sequence depends on at the start."""
+    deps = {r: {r} for r in range(15)}
+    for word in words:
+        deps[writes(word)] = set().union(*(deps[r] for r in reads(word)))
+    return deps
+
+def alphabet(registers):
+    """
+    Makes every instruction a candidate can be built from
+        - Accepts the registers candidates are allowed to use
+        - ADD, AND and OR only get one order of their two registers since the other order does the same thing
+        - Returns a list of words
+    """
+    registers = sorted(registers)
+    words = []
+    for op in (0, 1, 5, 6):
+        words += [sim.encode_word(op, a, b) for a in registers for b in registers if op == 1 or a <= b]
+    words += [sim.encode_word(2, a, b) for a in registers for b in registers if a != b]
+    words += [sim.encode_word(7, a, b) for a in registers for b in registers]
+    words += [sim.encode_word(3, a, n) for a in registers for n in range(16)]
+    return words
+
+def sample_state(count, seed):
+    """Returns a (15, count) array of random register files (the first two are all zeros and all fifteens)."""
+    rng = np.random.default_rng(seed)
+    state = rng.integers(0, 16, size=(15, count), dtype=np.uint8)
+    state[:, :2] = np.array([[0, 15]], dtype=np.uint8)[:, :count]
+    return state
+
+# ========================== Verification ==========================
+def equivalent(a, b, seed=0):
+    """
+    Checks whether two jump-free sequences always leave every register the same
+        - Accepts the two lists of words
+        - Each register is checked on every combination of the registers its result depends on in either sequence
+          (nothing else can change it), registers with the same dependencies are checked together
+            - if that's more than EXHAUSTIVE_LIMIT combinations, that many random ones are tried instead
+        - Returns (True or False, "exhaustive" or "sampled" if any register could only be sampled)
+    """
+    deps_a, deps_b = depends(a), depends(b)
+    groups = {}     # registers it depends on -> registers to check
+    for r in range(15):
+        groups.setdefault(tuple(sorted(deps_a[r] | deps_b[r])), []).append(r)
+
+    method = "exhaustive"
+    for domain, registers in groups.items():
+        if 16**len(domain) <= EXHAUSTIVE_LIMIT:
+            state = sample_state(16**len(domain), seed)
+            if domain:
+                state[list(domain)] = np.indices((16,)*len(domain), dtype=np.uint8).reshape(len(domain), -1)
+        else:
+            state = sample_state(EXHAUSTIVE_LIMIT, seed)
+            method = "sampled"
+        if not np.array_equal(apply(a, state)[registers], apply(b, state)[registers]):
+            return False, method
+    return True, method
+
+# ========================== Search ==========================
+def search(task):
+    """
+    Searches every sequence of one length that starts with one instruction (the work for one worker)
+        - Accepts (target words, length, first word, the alphabet)
+        - Returns (words, verification method) for the first sequence found, or None
+    """
+    target, length, first, words = task
+    state = sample_state(SAMPLES, 0)
+    expected = apply(target, state)
+
+    def dfs(state, left, prefix):
+        if _stop is not None and _stop.is_set():
+            return None     # another worker already found one this long
+        # every instruction changes one register, so if more than `left` are still wrong there's no point going on
+        wrong = int((state != expected).any(axis=1).sum())
+        if wrong == 0:
+            ok, method = equivalent(target, prefix)
+            return (prefix, method) if ok else None
+        if wrong > left:
+            return None
+        for word in words:
+            op, v1, v2 = sim.decode_word(word)
+            nxt = state.copy()
+            sim._ops[op](nxt, v1, v2)
+            if np.array_equal(nxt, state):
+                continue    # does nothing here, a shorter sequence without it was already tried
+            found = dfs(nxt, left - 1, prefix + [word])
+            if found:
+                return found
+        return None
+
+    return dfs(apply([first], state), length - 1, [first])
+
+def _init_worker(stop):
+    """Gives a worker process the shared stop flag (the pool's initializer)."""
+    global _stop
+    _stop = stop
+
+def make_pool(workers=None):
+    """Starts the worker processes for `superoptimize`, all sharing one stop flag with this process."""
+    global _stop
+    _stop = multiprocessing.Event()
+    return Pool(workers, initializer=_init_worker, initargs=(_stop,))
+
+def superoptimize(target, max_length=None, pool=None):
+    """
+    Finds the shortest sequence that does the same as a jump-free one
+        - Accepts the words, the longest sequence to try (one less than the target if None) and a pool from `make_pool`
+          (runs in this process if None)
+        - Once a match turns up, the searches still running for that length are told to stop
+        - Only the registers the target uses are used (R0 too if it has an ADD, SUB, AND or OR)
+        - Returns (words, verification method) or None if nothing shorter was found
+    """
+    registers = set()
+    for word in target:
+        op, v1, v2 = sim.decode_word(word)
+        registers |= set(sim.register_operands(op, v1, v2)) | {writes(word)}
+    words = alphabet(registers)
+
+    longest = len(target) - 1 if max_length is None else min(max_length, len(target) - 1)
+    for length in range(1, longest + 1):
+        tasks = [(target, length, first, words) for first in words]
+        if pool:
+            _stop.clear()
+        results = pool.imap(search, tasks, chunksize=4) if pool else map(search, tasks)
+        found = next((found for found in results if found), None)
+        if found:
+            if pool:
+                _stop.set()
+                for _ in results:
+                    pass    # the rest return straight away now, wait for them so the next search starts clean
+            return found
+    return None
+
+# ========================== Programs ==========================
+def blocks(program):
+    """
+    Splits a program into blocks that can be rewritten on their own
+        - A block starts at P0, at every jump target and after every jump, and stops before the next of any of those
+        - Blocks using R15 are left out (they fault, and have to keep faulting in the same place)
+        - Returns a list of (start, stop) address ranges with at least two words in them
+    """
+    targets = {(word >> 4) & 0xF for word in program if word >> 8 == 4}
+    found = []
+    start = 0
+    for addr in range(17):
+        if addr == 16 or addr in targets or program[addr] >> 8 == 4:
+            if addr - start >= 2 and all(15 not in sim.register_operands(*sim.decode_word(w)) for w in program[start:addr]):
+                found.append((start, addr))
+            start = addr + 1 if addr < 16 and program[addr] >> 8 == 4 else addr
+    return found
+
+def optimize_program(program, max_length=None, pool=None, log=print):
+    """
+    Superoptimizes every block of a program
+        - Accepts 16 words, the longest replacement to look for, a process pool and a function for progress lines
+        - Returns the new 16 words (see the README at the top for where the shorter blocks go)
+    """
+    program = list(program) + [0]*(16 - len(program))
+    stretches = []
+    for start, stop in blocks(program):
+        target = program[start:stop]
+        began = time.perf_counter()
+        found = superoptimize(target, max_length, pool)
+        if not found:
+            log(f"P{start}-P{stop - 1}: nothing shorter ({time.perf_counter() - began:.1f}s)")
+            continue
+        words, method = found
+        if method != "exhaustive":
+            log(f"P{start}-P{stop - 1}: {len(target)} -> {len(words)} words, but too many registers to check every value, left alone")
+            continue
+        stretches.append((start, stop, words))
+        log(f"P{start}-P{stop - 1}: {len(target)} -> {len(words)} words ({method} check, {time.perf_counter() - began:.1f}s)")
+        log("  " + sim.disassemble(target, labels=False, trim=False).rstrip().replace("\n", "\n  "))
+        log("  =>")
+        log("  " + sim.disassemble(words, labels=False, trim=False).rstrip().replace("\n", "\n  "))
+    return sim.shrink_stretches(program, stretches)[0]
+
+def cli(argv=None):
+    """
+    Parses the command line and superoptimizes a program
+        - Accepts an optional list of arguments (defaults to sys.argv)
+        - Returns nothing
+            - the report is printed, the new program is printed as assembly and saved with --out
+    """
+    parser = argparse.ArgumentParser(description="Find shorter equivalent code for a 4-bit CPU program")
+    parser.add_argument("program_file", help="program to optimize (text, .asm or a binary image)")
+    parser.add_argument("--max-length", type=int, help="longest replacement to look for (searches get much slower past 3 or 4)")
+    parser.add_argument("--workers", type=int, help="worker processes (defaults to one per core)")
+    parser.add_argument("--out", metavar="FILE", help="save the optimized program as a binary image")
+    args = parser.parse_args(argv)
+    if np is None:
+        sys.exit("superopt.py needs numpy (pip install numpy)")
+
+    program = sim.read_program_file(args.program_file)
+    with make_pool(args.workers) as pool:
+        new = optimize_program(program, args.max_length, pool)
+    print()
+    print(sim.disassemble(new), end="")
+    if args.out:
+        sim.save_image(args.out, new)
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,172 @@
+# -----------------------------------------------------
+# README!
+#
+# Runs a lot of programs through the simulator at once, spread over every core.
+#
+# PROGRAMS:
+# words: every one of the 2048 possible words on its own in P0 (the rest of memory is zero)
+# random: N random 16 word programs (--count N)
+# corpus: every program in a binary image file (--corpus FILE, see `write_corpus` in the simulator), each worker maps the
+#         file itself so only record numbers are sent between processes
+#
+# Every program is run once for each starting register set (--register-sets N, the first set is all zeros, the rest are random).
+# Each run goes through `CPU.fast_forward` with the cycle budget, so the result is the exact state after that many cycles
+# plus whether the program halted, looped, faulted or just ran out of budget.
+#
+# CACHE:
+# with --cache FILE every result is remembered in an SQLite file (see `ResultCache` in the simulator), so running the
+# same programs with the same register sets and budget again only looks the answers up
+#
+# OUTPUT:
+# one json line per run is written to --out as soon as its shard finishes, then a summary is printed
+#
+# Example:
+# python3 tools/sweep.py words --register-sets 4 --max-cycles 100000 --out words.jsonl
+# -----------------------------------------------------
+
+import argparse, json, random, time
+from multiprocessing import Pool
+
+from _sim import sim
+
+_corpora = {}   # corpus files this process has mapped, by path
+_caches = {}    # result caches this process has opened, by path
+
+# ========================== Job Generation ==========================
+def register_sets(count, seed):
+    """
+    Makes the starting register sets every program is run with
+        - Accepts how many sets to make and a seed for the random ones
+        - Returns a list of lists of 15 values, the first one is always all zeros
+    """
+    rng = random.Random(seed)
+    return [[0]*15] + [[rng.randrange(16) for _ in range(15)] for _ in range(count - 1)]
+
+def job_program(mode, source, index):
+    """
+    Works out the program for one job from just its number, so shards can be handed out without the programs themselves
+        - Accepts the sweep mode ("words", "random" or "corpus"), the seed (the corpus path for "corpus") and the program number
+        - Returns a tuple of 16 11-bit words
+    """
+    if mode == "words":
+        return (index,) + (0,)*15
+    if mode == "corpus":
+        if source not in _corpora:
+            _corpora[source] = sim.Corpus(source)
+        return _corpora[source].program(index)
+    seed = source
+    rng = random.Random(f"{seed}:{index}")
+    return tuple(rng.randrange(2048) for _ in range(16))
+
+def shards(total, size):
+    """Splits job numbers 0 to total-1 into (start, stop) ranges of at most `size` jobs."""
+    for start in range(0, total, size):
+        yield start, min(start + size, total)
+
+# ========================== Workers ==========================
+def run_shard(task):
+    """
+    Runs one shard of jobs in a worker process
+        - Accepts (mode, seed or corpus path, register sets, cycle budget, start, stop, result cache path or None)
+        - Job number i is program i // len(register sets) with register set i % len(register sets)
+        - Returns a list of result dicts, one per job, and how many of them came out of the cache
+    """
+    mode, source, reg_sets, max_cycles, start, stop, cache_path = task
+    if cache_path not in _caches:
+        _caches[cache_path] = sim.ResultCache(cache_path)
+    cache = _caches[cache_path]
+    hits = cache.hits
+
+    results = []
+    for job in range(start, stop):
+        program = job_program(mode, source, job // len(reg_sets))
+        registers = reg_sets[job % len(reg_sets)]
+
+        result = cache.run(program, registers, max_cycles)
+        results.append({
+            "job": job,
+            "program": list(program),
+            "initial": registers,
+            "verdict": result["verdict"],
+            "start": result["start"],
+            "period": result["period"],
+            "cycles": result["cycles"],
+            "registers": result["registers"],
+            "clock": result["clock"],
+        })
+    cache.flush()   # workers are never told they're finishing, so everything is written before the shard is handed back
+    return results, cache.hits - hits
+
+# ========================== Sweep ==========================
+def sweep(mode, count, reg_sets, max_cycles, out, seed=0, workers=None, shard_size=256, corpus=None, cache=None):
+    """
+    Runs the whole sweep over a process pool and streams the results to a file
+        - Accepts the mode, the number of programs (ignored for "words" and "corpus"), the register sets, the cycle budget,
+          an open file for the json lines, a seed, the number of worker processes, the number of jobs per shard
+          the corpus file (only for "corpus") and the result cache file (None for no cache between sweeps)
+        - Shards are finished in whatever order the workers get to them, the `job` field says which is which
+        - Returns a summary dict with the number of jobs, the count of every verdict, total cycles, cache hits and elapsed time
+    """
+    source = seed
+    if mode == "words":
+        programs = 2048
+    elif mode == "corpus":
+        with sim.Corpus(corpus) as c:
+            programs = len(c)
+        source = corpus
+    else:
+        programs = count
+    total = programs * len(reg_sets)
+    tasks = ((mode, source, reg_sets, max_cycles, start, stop, cache) for start, stop in shards(total, shard_size))
+
+    verdicts = {}
+    cycles = 0
+    hits = 0
+    start = time.perf_counter()
+    with Pool(workers) as pool:
+        for results, shard_hits in pool.imap_unordered(run_shard, tasks):
+            hits += shard_hits
+            for result in results:
+                out.write(json.dumps(result) + "\n")
+                verdicts[result["verdict"]] = verdicts.get(result["verdict"], 0) + 1
+                cycles += result["cycles"]
+
+    return {"jobs": total, "verdicts": verdicts, "cycles": cycles, "cache_hits": hits, "elapsed": time.perf_counter() - start}
+
+def cli(argv=None):
+    """
+    Parses the command line and runs a sweep
+        - Accepts an optional list of arguments (defaults to sys.argv)
+        - Returns nothing
+            - results go to --out, the summary is printed
+    """
+    parser = argparse.ArgumentParser(description="Run many programs through the 4-bit CPU simulator in parallel")
+    parser.add_argument("mode", choices=("words", "random", "corpus"),
+                        help="every single word, random 16 word programs, or every program in a corpus file")
+    parser.add_argument("--count", type=int, default=1000, help="number of random programs")
+    parser.add_argument("--corpus", metavar="FILE", help="binary image file to run (corpus mode)")
+    parser.add_argument("--register-sets", type=int, default=1, help="starting register sets per program (the first is all zeros)")
+    parser.add_argument("--max-cycles", type=int, default=10000, help="cycle budget for every run")
+    parser.add_argument("--seed", type=int, default=0, help="seed for random programs and register sets")
+    parser.add_argument("--workers", type=int, help="worker processes (defaults to one per core)")
+    parser.add_argument("--shard-size", type=int, default=256, help="jobs handed to a worker at a time")
+    parser.add_argument("--cache", metavar="FILE", help="SQLite file to remember results in between sweeps")
+    parser.add_argument("--out", default="sweep.jsonl", help="file for the per-run results (one json object per line)")
+    args = parser.parse_args(argv)
+    if args.mode == "corpus" and not args.corpus:
+        parser.error("corpus mode needs --corpus FILE")
+
+    with open(args.out, "w") as out:
+        summary = sweep(args.mode, args.count, register_sets(args.register_sets, args.seed), args.max_cycles,
+                        out, args.seed, args.workers, args.shard_size, args.corpus, args.cache)
+
+    print(f"Jobs:     {summary['jobs']}")
+    for verdict, n in sorted(summary["verdicts"].items()):
+        print(f"  {verdict}:\t{n}")
+    print(f"Cycles:   {summary['cycles']:,}")
+    if args.cache:
+        print(f"Cached:   {summary['cache_hits']:,}")
+    print(f"Elapsed:  {summary['elapsed']:.3f}s")
+
+if __name__ == "__main__":
+    cli()